@@ -1,20 +1,48 @@
-import pyomo.environ as pyo
-from itertools import product
-import pandas as pd
 import json
+import school_cache as cache
 import school_classes as cl
 import school_model as mod
+import school_solver as sol
+import school_output as out
+import school_warmstart as wst
+import school_heuristic as heu
+import school_lns as lns
+import school_rooms as rms
+import school_components as cmp
+import school_matrix as mx
 
 
 # sets
+courses_file = "data/Input/UniveCourses.csv"
+rooms_file = "data/Input/aule_.csv"
 period = ["1° Periodo", "2° Periodo", "3° Periodo", "4° Periodo"]
 campus = ["San Giobbe", "Palazzo Moro"]
-qualifications = json.load(open("data/input/qualifications_levels.json"))
-profiles = json.load(open("data/input/profiles.json"))
+qualifications = json.load(open("data/Input/qualifications_levels.json"))
+profiles = json.load(open("data/Input/profiles.json"))
 calendar = (4,6,6)
-
-# load data
-school = cl.School.create_school_from_data("data/input/UniveCourses.csv", qualifications, profiles, "data/input/aule_.csv", calendar)
+seed = 0
+cache_dir = "data/cache"
+cache_size = 2 * 1024**3  # bytes of cache_dir kept, least recently used models evicted first
+warm_start = True  # start from the previous schedules in data/Output
+preview = True  # write the greedy timetable to data/Preview before solving
+backend = "mip"  # "mip": Pyomo model and solver, "lns": large neighborhood search on the
+# model, "anneal": local search, no solver needed, "components": independent courses and
+# teachers solved in parallel processes, "matrix": the model as a sparse matrix given to HiGHS
+rooms = "rooms"  # "rooms": one variable per room, "types": one per (campus, room_size),
+# "matching": solve the time slots without rooms, then assign rooms by matching
+presolve = True  # drop the variables and constraints implied by the others (y, 2, 3, 4, 9)
+
+# load data, keeping only the teachings and rooms of the period and campus to solve
+school = cl.School.create_school_from_data(
+    courses_file,
+    qualifications,
+    profiles,
+    rooms_file,
+    calendar,
+    period=[period[2]],
+    campus=campus,
+    seed=seed,
+)
 # courses = school.course_classes
 # teachers = school.teacher_classes
 # teachings = school.teaching_classes
@@ -25,167 +53,108 @@ school = cl.School.create_school_from_data("data/input/UniveCourses.csv", qualif
 parameters = cl.define_parameters(period[2], "relaxed")
 
 # filter data
-school.calendar_classes = cl.CalendarClass.filter_by(school.calendar_classes, "period", [2])
-school.room_classes = cl.BaseClass.filter_by(school.room_classes, "campus", campus)
-school.course_classes = cl.BaseClass.filter_by(school.course_classes, "campus", campus)
-school.teaching_classes = cl.BaseClass.filter_by(school.teaching_classes, "campus", campus)
-school.teaching_classes = cl.BaseClass.filter_by(school.teaching_classes, "period", ["3° Periodo"])
-
-# remove teachings from courses and teachers outside the periods and campus # da inserire in filter_by
-for course in school.course_classes:
-    course.teachings = [
-        teaching
-        for teaching in course.teachings
-        if teaching.period == "3° Periodo" and teaching.campus in campus
-    ]
-    
-for teacher in school.teacher_classes:
-    teacher.teachings = [
-        teaching
-        for teaching in teacher.teachings
-        if teaching.period == "3° Periodo" and teaching.campus in campus
-    ]
-
-#  remove courses and teachers without teachings, and teachings without courses and teachers
-school.course_classes = [
-    course
-    for course in school.course_classes
-    if len(course.teachings) > 0
-]
-
-school.teacher_classes = [
-    teacher
-    for teacher in school.teacher_classes
-    if len(teacher.teachings) > 0
-]
-
-
-# ----------------------------------Model & Sets------------------------------------
-sets = mod.set_creation(school)
-model = mod.model_creation()
-
-# ------------------------------------Variables-------------------------------------
-model.x, model.y, model.z = mod.model_variables(model, sets)
-
-# ------------------------------------Parameters------------------------------------
-model.prof_cost, model.cal_cost = mod.model_parameters(model, sets, school, profiles)
-
-# --------------------------------Objective function--------------------------------
-model.obj = mod.model_objective(model, sets, school)
-
-# ----------------------------------Costraint---------------------------------------
-# Assignment Costraint
-model.all_courses = mod.all_courses(model, sets, school)
-model.all_teachers = mod.all_teachers(model, sets, school)
-model.all_rooms = mod.all_rooms(model, sets, school)
-model.room_size = mod.room_size(model, sets, school, parameters)
-
-# Ubiquity Costraint
-model.ubiquity_stud = mod.ubiquity_stud(model, sets, school, parameters)
-model.ubiquity_professor = mod.ubiquity_professor(model, sets, school)
-model.ubiquity_rooms = mod.ubiquity_rooms(model, sets, school)
-
-# Liniking Variables
-model.link_z_x = mod.link_z_x(model, sets, school)
-model.link_y_x = mod.link_y_x(model, sets, school)
-
-# Daily Costraint
-model.repeat_teaching = mod.repeat_teaching(model, sets, school)
-model.student_presence = mod.student_presence(model, sets, school)
-model.professor_presence = mod.professor_presence(model, sets, school)
-
-# Optional Constraints
-model.free_room = mod.free_room(model, sets, school, parameters)
-# model.max_hours_per_day = mod.max_hours_per_day(model, sets, school, parameters)
-model.professor_limit = mod.professor_limit(model, sets, school)
-
-
-# --------------------------------Solver--------------------------------
-solver = pyo.SolverFactory(
-    "cplex",
-    executable="C:/Program Files/IBM/ILOG/CPLEX_Studio2211/cplex/bin/x64_win64/cplex.exe",
-)
-solver.options['timelimit'] = 600
-results = solver.solve(model, tee=True)
-print(results)
-print(model.obj())
-
+# calendar periods are numbered from 1 in the order of period
+school.filter_by("calendar_classes", "period", [period.index(parameters[0]) + 1])
+prof_cost = school.build_prof_cost(profiles, seed, cache_dir)
+
+
+# ----------------------------------Preview------------------------------------------
+# instant timetable from the greedy heuristic, no solver needed
+if preview:
+    # restarts within a time budget to stay under a second; anneal and lns keep them all
+    greedy, greedy_report = heu.greedy_timetable(school, parameters, prof_cost, time_limit=0.8)
+    out.write_schedules(greedy.to_solution(), school, "data/Preview")
+
+# ------------------------------------Local search------------------------------------
+# simulated annealing from the greedy timetable (or the previous schedules)
+if backend == "anneal":
+    if warm_start:
+        start, warm_report = wst.warm_state(school, parameters, "data/Output", prof_cost)
+    else:
+        start, greedy_report = heu.greedy_timetable(school, parameters, prof_cost, seed=seed)
+    timetable, results = heu.anneal(
+        school, parameters, prof_cost, state=start, iterations=1000000, time_limit=600, seed=seed
+    )
+    solution = timetable.to_solution()
+
+# ------------------------------------Components------------------------------------
+# one model per group of courses and teachers sharing no teaching, solved in parallel
+elif backend == "components":
+    solver = sol.SolverConfig("auto", time_limit=600, mip_gap=None, threads=None, seed=seed)
+    solution, results = cmp.solve_by_components(school, parameters, profiles, prof_cost, solver, seed=seed)
+
+# ------------------------------------Matrix------------------------------------
+# the same model built as a scipy.sparse matrix, without Pyomo, and solved by HiGHS; the
+# matrix is cached by the hash of the inputs, so a second run with the same data skips the build
+elif backend == "matrix":
+    key = cache.input_hash(
+        cache.file_hash(courses_file),
+        cache.file_hash(rooms_file),
+        qualifications,
+        profiles,
+        calendar,
+        period[2],
+        campus,
+        seed,
+    )
+    matrix = mx.cached_model(school, parameters, prof_cost, key, rooms, presolve, cache_dir, cache_size)
+    # matrix.write("data/Output/model.mps")  # MPS or LP for solvers outside Python
+    # on little memory, stream the LP without building the matrix (see MatrixModel.write_lp):
+    # mx.MatrixModel(school, parameters, prof_cost, rooms, presolve, build=False).write_lp("data/Output/model.lp")
+    start = None
+    if warm_start:
+        start, warm_report = wst.warm_state(school, parameters, "data/Output", prof_cost)
+        start = start.to_solution()
+    solver = sol.SolverConfig("highs", time_limit=600, mip_gap=None, threads=None, seed=seed, tee=True)
+    values, results = matrix.solve(solver, start)
+    if values is None:
+        raise RuntimeError(f"No timetable found by HiGHS on the matrix model: {results.status}")
+    solution = matrix.to_solution(values)
+
+else:
+    # ----------------------------------Model & Sets------------------------------------
+    # sets, variables, parameters, objective function and constraints, see school_model
+    model, sets = mod.build_model(school, parameters, profiles, rooms, seed, cache_dir, presolve)
+
+    # --------------------------------Solver--------------------------------
+    if backend == "lns":
+        # large neighborhood search from a complete timetable: the previous schedules
+        # completed by the greedy heuristic, or the greedy timetable; a start with lectures
+        # missing or alone on their day is not feasible for the model, the MIP is solved
+        # instead
+        if warm_start:
+            start, warm_report = wst.warm_state(school, parameters, "data/Output", prof_cost)
+        else:
+            start, greedy_report = heu.greedy_timetable(school, parameters, prof_cost, seed=seed)
+        if start.missing() or start.lone_days():
+            print(
+                f"LNS not started: the start timetable has {start.missing()} missing lectures and "
+                f"{start.lone_days()} lone days, solving the MIP instead"
+            )
+            backend = "mip"
+        else:
+            wst.apply_start(model, start.to_solution(), school=school)
+            solver = sol.SolverConfig("highs", mip_gap=None, threads=None, seed=seed)
+            history = lns.lns(model, school, solver, iterations=50, time_limit=600, sub_time_limit=30, seed=seed)
+    if backend != "lns":
+        if warm_start:
+            wst.load_warm_start(model, school, parameters, "data/Output", prof_cost)
+
+        # "auto" picks the first available of cplex, highs, cbc, glpk; a cplex installed
+        # outside the PATH can be given with executable=".../cplex.exe"
+        solver = sol.SolverConfig(
+            "auto", time_limit=600, mip_gap=None, threads=None, seed=seed, tee=True, warmstart=warm_start
+        )
+        results = sol.solve(model, solver)
+        print(results)
+        # the model keeps the warm start values when the solver finds nothing
+        if not results.has_solution():
+            raise RuntimeError(f"No timetable found by the solver: {results.status}")
+    print(model.obj())
+    solution = out.extract_solution(model)
+    solution = rms.solution_rooms(model, solution, school, parameters)
 
 # --------------------------------Output--------------------------------
-days = [d for d, h in list(product(sets["days"], sets["hours"]))]
-hours = [h for d, h in list(product(sets["days"], sets["hours"]))]
-# --------------------------------ROOM OCCUPATION--------------------------------
-
-cal_r = pd.DataFrame(columns=list(school.room_classes))
-cal_r["day"] = days
-cal_r["hour"] = hours
-cal_r.set_index([days, hours], inplace=True)
-cal_r.drop(["day", "hour"], axis=1, inplace=True)
-
-for d in days:
-    for h in hours:
-        for t in school.teaching_classes:
-            for r in school.room_classes:
-                if pyo.value(model.z[d, h, t.name, r.name]) == 1:
-                    cal_r.loc[(d, h), r.name] = t.name
-
-cal_r.fillna("-", inplace=True)
-# pd.set_option("display.max_columns", None)
-# pd.set_option("display.max_colwidth", 1000)
-# print(cal_r)
-cal_r.to_csv("data/output/schedule_rooms.csv")
-
-# --------------------------------PROFESSOR SCHEDULE--------------------------------
-# Creating the output dataset
-cal_p = pd.DataFrame(columns=list(school.teacher_classes))
-cal_p["day"] = days
-cal_p["hour"] = hours
-cal_p.set_index([days, hours], inplace=True)
-cal_p.drop(["day", "hour"], axis=1, inplace=True)
-
-for d in days:
-    for h in hours:
-        for teacher in school.teacher_classes:
-            for teaching in teacher.teachings:
-                if pyo.value(model.y[d, h, teacher.name, teaching.name]) == 1:
-                    cal_p.loc[(d, h), teacher.name] = teaching.name
-
-cal_p.fillna("-", inplace=True)
-# pd.set_option("display.max_columns", None)
-# pd.set_option("display.max_colwidth", 1000)
-# print(cal_p)
-cal_p.to_csv("data/output/schedule_teachers.csv")
-
-# --------------------------------COURSE SCHEDULE--------------------------------
-cal_c = pd.DataFrame(columns=list(school.course_classes))
-cal_c["day"] = days
-cal_c["hour"] = hours
-cal_c.set_index([days, hours], inplace=True)
-cal_c.drop(["day", "hour"], axis=1, inplace=True)
-
-# # Printing the rooms where lectures take place
-# for d in days:
-#     for h in hours:
-#         for course in courses:
-#             for teaching in course.teachings:
-#                 if pyo.value(model.x[d, h, course.name, teaching.name]) == 1:
-#                     cal_c.loc[(d, h), course.name] = teaching.name
-                    
-for d in days:
-    for h in hours:
-        for course in school.course_classes:
-            teachings_for_cell = []  # Lista per memorizzare tutti gli insegnamenti per la stessa cella
-            for teaching in course.teachings:
-                if pyo.value(model.x[d, h, course.name, teaching.name]) == 1:
-                    # Aggiungi gli insegnamenti alla lista
-                    # teaching_identifier = f"{teaching.name}_{i}"
-                    teachings_for_cell.append(teaching.name)
-            
-            # Unisci gli insegnamenti separati da virgola nella stessa cella
-            cal_c.loc[(d, h), course.name] = ", ".join(teachings_for_cell)
-
-cal_c.fillna("-", inplace=True)
-# pd.set_option("display.max_columns", None)
-# pd.set_option("display.max_colwidth", 1000)
-# print(cal_c)
-cal_c.to_csv("data/output/schedule_courses.csv")
+# one row per lecture (day, hour, course, teaching, teacher, room), pivoted into
+# the room, professor and course schedules
+out.write_schedules(solution, school, "data/Output")
@@ -0,0 +1,89 @@
+import hashlib
+import json
+import os
+import tempfile
+
+import numpy as np
+
+
+# sha256 of json-serializable inputs (numpy scalars and other objects are hashed by str)
+def input_hash(*inputs):
+    digest = hashlib.sha256()
+    for item in inputs:
+        digest.update(json.dumps(item, sort_keys=True, default=str).encode())
+    return digest.hexdigest()
+
+
+# sha256 of the content of a file, e.g. an input csv
+def file_hash(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+# load the array stored under name/key in cache_dir, or build and store it;
+# files are written atomically so parallel runs can share the same cache_dir
+def cached_array(cache_dir, name, key, build):
+    if cache_dir is None:
+        return build()
+    path = os.path.join(cache_dir, f"{name}_{key[:16]}.npy")
+    if os.path.exists(path):
+        os.utime(path)  # last use, see evict
+        return np.load(path)
+
+    array = build()
+    os.makedirs(cache_dir, exist_ok=True)
+    with tempfile.NamedTemporaryFile(dir=cache_dir, suffix=".tmp", delete=False) as f:
+        np.save(f, array)
+    os.replace(f.name, path)
+    return array
+
+
+# same for a dict of arrays, stored in one .npz; with max_size (bytes) the least recently
+# used files of cache_dir are evicted once they take more
+def cached_arrays(cache_dir, name, key, build, max_size=None):
+    if cache_dir is None:
+        return build()
+    path = os.path.join(cache_dir, f"{name}_{key[:16]}.npz")
+    try:
+        with np.load(path) as f:
+            arrays = dict(f)
+        os.utime(path)
+        print(f"Loaded {name} from {path}")
+        return arrays
+    except FileNotFoundError:
+        pass
+
+    arrays = build()
+    os.makedirs(cache_dir, exist_ok=True)
+    with tempfile.NamedTemporaryFile(dir=cache_dir, suffix=".tmp", delete=False) as f:
+        np.savez(f, **arrays)
+    os.replace(f.name, path)
+    if max_size is not None:
+        evict(cache_dir, max_size)
+    return arrays
+
+
+# remove the cached files of cache_dir from the least recently used (loading a file
+# updates its modification time) until the rest takes at most max_size bytes; the most
+# recent file is always kept. Files removed meanwhile by another run are skipped
+def evict(cache_dir, max_size):
+    files = []
+    for entry in os.scandir(cache_dir):
+        if entry.name.endswith((".npy", ".npz")):
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, entry.path))
+    total = 0
+    for i, (mtime, size, path) in enumerate(sorted(files, reverse=True)):
+        total += size
+        if i and total > max_size:
+            try:
+                os.remove(path)
+                print(f"Evicted {path} from the cache")
+            except FileNotFoundError:
+                pass
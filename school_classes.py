@@ -1,11 +1,36 @@
+import numpy as np
 import pandas as pd
 import itertools
-import random
-
 
+import school_cache as cache
+
+
+# columns (and their dtypes) read from the courses and rooms csv files
+COURSES_DTYPES = {
+    "Teachings": str,
+    "Period": str,
+    "Professor": "int64",
+    "Anno": "int64",
+    "CAMPUS": str,
+    "room_size": "int64",
+    "Partition": str,
+    "k": "int64",
+    "grappolo": str,
+    "qualifica": str,
+    "Course_ID": str,
+}
+ROOMS_DTYPES = {"campus": str, "room": str, "room_size": "int64"}
+CALENDAR_DTYPES = {"period": "int64", "day": "int64", "hour": "int64", "cost": "float64"}
+
+
+# entities use __slots__ (no per-instance __dict__); id is the position of the
+# instance in its School list, i.e. its row in School.get_columns()
 class BaseClass:
+    __slots__ = ()
+    dtypes = None
+
     def __repr__(self):
-        return f"{', '.join(f'{key}={value}' for key, value in self.__dict__.items())}"
+        return f"{', '.join(f'{key}={getattr(self, key)}' for key in self.__slots__ if key != 'id')}"
 
     @classmethod
     def from_data(cls, data):
@@ -13,29 +38,41 @@ class BaseClass:
         return data
 
     @classmethod
-    def read_class(cls, filename):
-        data = pd.read_csv(filename)
-        instances = [cls.from_data(row) for _, row in data.iterrows()]
+    def read_data(cls, filename):
+        return pd.read_csv(filename, usecols=list(cls.dtypes), dtype=cls.dtypes)
+
+    # data can be a filename or a frame already read with read_data
+    @classmethod
+    def read_class(cls, data):
+        if not isinstance(data, pd.DataFrame):
+            data = cls.read_data(data)
+        instances = [cls.from_data(row) for row in data.to_dict("records")]
         return instances
 
     @staticmethod
     def filter_by(objects, attribute, parameter_list):
-        instances_to_remove = [
+        parameter_list = set(parameter_list)
+        objects[:] = [
             instance
             for instance in objects
-            if getattr(instance, attribute) not in parameter_list
+            if getattr(instance, attribute) in parameter_list
         ]
-
-        for instance in instances_to_remove:
-            objects.remove(instance)
-
         return objects
 
+    # same as filter_by, but on the raw data before any instance is created
+    @staticmethod
+    def filter_data(data, column, parameter_list):
+        if parameter_list is None:
+            return data
+        return data[data[column].isin(parameter_list)]
+
 
 class TeachingClass(BaseClass):
-    all = []
+    __slots__ = ("id", "name", "course", "teacher", "campus", "partition", "period", "elective", "frequency", "size")
+    dtypes = COURSES_DTYPES
 
     def __init__(self, name, course, teacher, campus, partition, period, elective, frequency, size):
+        self.id = None
         self.name = name
         self.course = course
         self.teacher = teacher
@@ -45,7 +82,6 @@ class TeachingClass(BaseClass):
         self.elective = elective
         self.frequency = frequency
         self.size = size
-        TeachingClass.all.append(self)
 
     @classmethod
     def from_data(cls, data):
@@ -64,20 +100,22 @@ class TeachingClass(BaseClass):
 
 
 class CourseClass(BaseClass):
-    all = []
+    __slots__ = ("id", "name", "teachings", "partition", "year", "campus", "size")
+    dtypes = COURSES_DTYPES
 
     def __init__(self, name, teachings, partition, year, campus, size):
+        self.id = None
         self.name = name
         self.teachings = teachings
         self.partition = partition
         self.year = year
         self.campus = campus
         self.size = size
-        CourseClass.all.append(self)
 
     @classmethod
-    def read_class(cls, filename):
-        data = pd.read_csv(filename)
+    def read_class(cls, data, school):
+        if not isinstance(data, pd.DataFrame):
+            data = cls.read_data(data)
         grouped_course = (
             data.groupby(["Course_ID", "Partition"])
             # data.groupby("Course_ID")
@@ -91,15 +129,15 @@ class CourseClass(BaseClass):
             )
             .reset_index()
         )
-        instances = [cls.from_data(row) for _, row in grouped_course.iterrows()]
+        instances = [cls.from_data(row, school) for row in grouped_course.to_dict("records")]
         return instances
 
     @classmethod
-    def from_data(cls, data):
+    def from_data(cls, data, school):
         teachings = [
-            teaching
-            for teaching in TeachingClass.all
-            if teaching.name in data["Teachings"]
+            school.teachings_by_name[teaching_name]
+            for teaching_name in data["Teachings"]
+            if teaching_name in school.teachings_by_name
         ]
 
         courses = cls(
@@ -114,38 +152,32 @@ class CourseClass(BaseClass):
 
 
 class TeacherClass(BaseClass):
-    all = []
+    __slots__ = ("id", "name", "teachings", "courses", "seniority", "profile")
+    dtypes = COURSES_DTYPES
 
     def __init__(self, name, teachings, courses, seniority, profile=None):
+        self.id = None
         self.name = name
         self.teachings = teachings
         self.courses = courses
         self.seniority = seniority
         self.profile = profile
-        TeacherClass.all.append(self)
 
     @classmethod
-    def read_class(cls, filename):
-        data = pd.read_csv(filename)
+    def read_class(cls, data, school):
+        if not isinstance(data, pd.DataFrame):
+            data = cls.read_data(data)
         grouped_teachings = (
             data.groupby("Professor")
-            .agg({"Teachings": list, "qualifica": "first"})
+            .agg({"Teachings": list, "qualifica": "first", "Course_ID": list})
             .reset_index()
         )
-        grouped_courses = (
-            data.groupby("Professor").agg({"Course_ID": list}).reset_index()
-        )
-        grouped_teachings["Course_ID"] = grouped_courses["Course_ID"]
-        instances = [cls.from_data(row) for _, row in grouped_teachings.iterrows()]
+        instances = [cls.from_data(row, school) for row in grouped_teachings.to_dict("records")]
         return instances
 
     @classmethod
-    def from_data(cls, data):
-        teachings = [
-            teaching
-            for teaching in TeachingClass.all
-            if teaching.teacher == data["Professor"]
-        ]
+    def from_data(cls, data, school):
+        teachings = list(school.get_teachings_by_teacher(data["Professor"]))
 
         return cls(
             name=data["Professor"],
@@ -155,32 +187,34 @@ class TeacherClass(BaseClass):
             profile=None,
         )
 
-    @classmethod
-    def assign_attributes(cls, qualifications, profiles):
-        for teacher in cls.all:
-            teacher.profile = profiles.index(random.choice(profiles))
+    @staticmethod
+    def assign_attributes(teachers, qualifications, profiles, seed=0):
+        rng = np.random.default_rng(seed)
+        for teacher in teachers:
+            teacher.profile = int(rng.integers(len(profiles)))
 
             if teacher.seniority in qualifications:
                 teacher.seniority = qualifications[teacher.seniority]
             else:
                 teacher.seniority = 0.5
-        return cls.all
+        return teachers
 
 
 class CalendarClass(BaseClass):
-    all = []
+    __slots__ = ("id", "period", "day", "hour", "cost")
+    dtypes = CALENDAR_DTYPES
 
     def __init__(self, period, day, hour, cost=1.0):
+        self.id = None
         self.period = period
         self.day = day
         self.hour = hour
         self.cost = cost
-        CalendarClass.all.append(self)
 
     @classmethod
     def define_calendar(
         cls, n_period, n_days, n_hours, cost=1.0
-    ):  # read from file also an option
+    ):  # or read_class from a csv with period, day, hour, cost columns
         calendar = []
         for period, day, hour in itertools.product(
             range(1, n_period + 1), range(1, n_days + 1), range(1, n_hours + 1)
@@ -197,13 +231,14 @@ class CalendarClass(BaseClass):
 
 
 class RoomClass(BaseClass):
-    all = []
+    __slots__ = ("id", "name", "campus", "size")
+    dtypes = ROOMS_DTYPES
 
     def __init__(self, name, campus, size):
+        self.id = None
         self.name = name
         self.campus = campus
         self.size = size
-        RoomClass.all.append(self)
 
     @classmethod
     def from_data(cls, data):
@@ -231,6 +266,8 @@ def define_parameters(
     return parameters
 
 
+# a School owns all of its entities: nothing is registered at class level,
+# so independent schools can be built (and freed) side by side
 class School:
     def __init__(self):
         self.teaching_classes = []
@@ -238,68 +275,254 @@ class School:
         self.teacher_classes = []
         self.room_classes = []
         self.calendar_classes = []
+        self.room_compatibility = {}
+        self.room_compatibility_reverse = {}
+        self.room_types = {}
+        # hash indexes, kept in sync by add_* and filter_by
+        self.teachings_by_name = {}
+        self.teachings_by_teacher = {}
+        self.teachings_by_course = {}
+        self.teachings_by_campus = {}
+        self.teachings_by_period = {}
+        self.teachers_by_course = {}
+        # columnar view, built on demand by get_columns
+        self.columns = None
 
     def add_teaching_class(self, teaching_class):
+        teaching_class.id = len(self.teaching_classes)
         self.teaching_classes.append(teaching_class)
+        self.index_teaching_class(teaching_class)
+        self.columns = None
 
     def add_course_class(self, course_class):
+        course_class.id = len(self.course_classes)
         self.course_classes.append(course_class)
+        self.columns = None
 
     def add_teacher_class(self, teacher_class):
+        teacher_class.id = len(self.teacher_classes)
         self.teacher_classes.append(teacher_class)
+        self.index_teacher_class(teacher_class)
+        self.columns = None
     
     def add_room_class(self, room_class):
+        room_class.id = len(self.room_classes)
         self.room_classes.append(room_class)
+        self.columns = None
         
     def add_calendar_class(self, calendar_class):
+        calendar_class.id = len(self.calendar_classes)
         self.calendar_classes.append(calendar_class)
+        self.columns = None
 
     @classmethod
-    def create_school_from_data(cls, data, qualifications, profiles, rooms, calendar):
+    def create_school_from_data(
+        cls, data, qualifications, profiles, rooms, calendar, period=None, campus=None, seed=0
+    ):
         school = cls()
 
+        # read the courses csv once and share it between teachings, courses and teachers;
+        # period and campus are applied to the rows, so courses and teachers
+        # are only created from the teachings that survive the filters
+        # data and rooms can be filenames or frames already read with read_data, so several
+        # schools can be built from one read of the csv files
+        if not isinstance(data, pd.DataFrame):
+            data = TeachingClass.read_data(data)
+        data = BaseClass.filter_data(data, "Period", period)
+        data = BaseClass.filter_data(data, "CAMPUS", campus)
         teaching_instances = TeachingClass.read_class(data)
         for teaching_instance in teaching_instances:
             school.add_teaching_class(teaching_instance)
 
-        course_instances = CourseClass.read_class(data)
+        course_instances = CourseClass.read_class(data, school)
         for course_instance in course_instances:
             school.add_course_class(course_instance)
 
-        teacher_instances = TeacherClass.read_class(data)
+        teacher_instances = TeacherClass.read_class(data, school)
         for teacher_instance in teacher_instances:
             school.add_teacher_class(teacher_instance)
-        TeacherClass.assign_attributes(qualifications, profiles)
+        TeacherClass.assign_attributes(school.teacher_classes, qualifications, profiles, seed)
         
+        if not isinstance(rooms, pd.DataFrame):
+            rooms = RoomClass.read_data(rooms)
+        rooms = BaseClass.filter_data(rooms, "campus", campus)
         room_instances = RoomClass.read_class(rooms)
         for room_instance in room_instances:
             school.add_room_class(room_instance)
         
-        calendar_instances = CalendarClass.define_calendar(calendar[0], calendar[1], calendar[2])
+        # calendar is either (n_period, n_days, n_hours) or a csv file
+        if isinstance(calendar, str):
+            calendar_instances = CalendarClass.read_class(calendar)
+        else:
+            calendar_instances = CalendarClass.define_calendar(calendar[0], calendar[1], calendar[2])
         for calendar_instance in calendar_instances:
             school.add_calendar_class(calendar_instance)
 
         return school
     
+    def index_teaching_class(self, teaching_class):
+        self.teachings_by_name[teaching_class.name] = teaching_class
+        self.teachings_by_teacher.setdefault(teaching_class.teacher, []).append(teaching_class)
+        self.teachings_by_course.setdefault(teaching_class.course, []).append(teaching_class)
+        self.teachings_by_campus.setdefault(teaching_class.campus, []).append(teaching_class)
+        self.teachings_by_period.setdefault(teaching_class.period, []).append(teaching_class)
+
+    def index_teacher_class(self, teacher_class):
+        for course_name in dict.fromkeys(teacher_class.courses):
+            self.teachers_by_course.setdefault(course_name, []).append(teacher_class)
+
+    def build_indexes(self):
+        for classes in (
+            self.teaching_classes,
+            self.course_classes,
+            self.teacher_classes,
+            self.room_classes,
+            self.calendar_classes,
+        ):
+            for index, instance in enumerate(classes):
+                instance.id = index
+        self.columns = None
+
+        self.teachings_by_name = {}
+        self.teachings_by_teacher = {}
+        self.teachings_by_course = {}
+        self.teachings_by_campus = {}
+        self.teachings_by_period = {}
+        self.teachers_by_course = {}
+        for teaching_class in self.teaching_classes:
+            self.index_teaching_class(teaching_class)
+        for teacher_class in self.teacher_classes:
+            self.index_teacher_class(teacher_class)
+
+    # filter one of the school lists (e.g. "teaching_classes") and keep the indexes in sync
+    def filter_by(self, classes, attribute, parameter_list):
+        setattr(
+            self,
+            classes,
+            BaseClass.filter_by(getattr(self, classes), attribute, parameter_list),
+        )
+        if classes == "teaching_classes":
+            self.prune_teachings()
+        self.build_indexes()
+        return getattr(self, classes)
+
+    # remove the filtered out teachings from their courses and teachers (their ids would point
+    # at other rows of get_columns) and drop the courses and teachers left without teachings
+    def prune_teachings(self):
+        kept = set(teaching.name for teaching in self.teaching_classes)
+        for classes in ("course_classes", "teacher_classes"):
+            instances = []
+            for instance in getattr(self, classes):
+                teachings = [teaching for teaching in instance.teachings if teaching.name in kept]
+                if teachings or not instance.teachings:
+                    instance.teachings = teachings
+                    instances.append(instance)
+            setattr(self, classes, instances)
+
+    # numpy arrays of the attributes the model builders read in their inner loops,
+    # indexed by the instance id
+    def get_columns(self):
+        if self.columns is None:
+            self.columns = dict(
+                teaching_frequency=np.array([t.frequency for t in self.teaching_classes], dtype=np.int64),
+                teaching_mandatory=np.array(
+                    [t.elective == "Obbligatorio" for t in self.teaching_classes], dtype=bool
+                ),
+                teacher_seniority=np.array(
+                    [t.seniority for t in self.teacher_classes], dtype=np.float64
+                ),
+            )
+            self.columns.update(self.build_calendar_cost())
+        return self.columns
+
+    # day x hour cost matrix; if several periods are left in the calendar the first one wins
+    def build_calendar_cost(self):
+        days = sorted(set(c.day for c in self.calendar_classes))
+        hours = sorted(set(c.hour for c in self.calendar_classes))
+        day_ids = {day: i for i, day in enumerate(days)}
+        hour_ids = {hour: i for i, hour in enumerate(hours)}
+        cost = np.full((len(days), len(hours)), np.nan)
+        for c in reversed(self.calendar_classes):
+            cost[day_ids[c.day], hour_ids[c.hour]] = c.cost
+        return dict(
+            calendar_days=np.array(days, dtype=np.int64),
+            calendar_hours=np.array(hours, dtype=np.int64),
+            calendar_cost=cost,
+        )
+
+    # day x hour x teacher preference cost: a teacher pays (50 +- 5) * seniority in the
+    # slots of its profile and 1 elsewhere; seeded, and cached on disk by input hash
+    def build_prof_cost(self, profiles, seed=0, cache_dir=None):
+        columns = self.get_columns()
+        days, hours = columns["calendar_days"], columns["calendar_hours"]
+        teacher_profiles = np.array([t.profile for t in self.teacher_classes], dtype=np.int64)
+        key = cache.input_hash(
+            profiles,
+            seed,
+            days.tolist(),
+            hours.tolist(),
+            [(t.name, t.profile, t.seniority) for t in self.teacher_classes],
+        )
+
+        def build():
+            rng = np.random.default_rng(seed)
+            # profile_slots[p, d, h]: the (day, hour) slot is in profile p
+            profile_slots = np.array(
+                [
+                    np.isin(days, profile["days"])[:, None] & np.isin(hours, profile["hours"])[None, :]
+                    for profile in profiles
+                ],
+                dtype=bool,
+            )
+            in_profile = profile_slots[teacher_profiles].transpose(1, 2, 0)
+            noise = rng.integers(-5, 6, size=in_profile.shape)
+            return np.where(in_profile, (50 + noise) * columns["teacher_seniority"], 1.0)
+
+        return cache.cached_array(cache_dir, "prof_cost", key, build)
+
     def get_teachings_by_teacher(self, teacher_name):
-        return [
-            teaching_instance
-            for teaching_instance in self.teaching_classes
-            if teaching_instance.teacher == teacher_name
-        ]
+        return self.teachings_by_teacher.get(teacher_name, [])
 
     def get_teachers_by_course(self, course_name):
-        return [
-            teacher_instance
-            for teacher_instance in self.teacher_classes
-            if course_name in teacher_instance.courses
-        ]
-    
-    def get_teachings_by_course(self, course_name):
-        return [
-            teaching_instance
-            for teaching_instance in self.teaching_classes
-            if teaching_instance.course == course_name
-        ]
-
+        return self.teachers_by_course.get(course_name, [])
 
+    def get_teachings_by_course(self, course_name):
+        return self.teachings_by_course.get(course_name, [])
+
+    def get_teachings_by_campus(self, campus):
+        return self.teachings_by_campus.get(campus, [])
+
+    def get_teachings_by_period(self, period):
+        return self.teachings_by_period.get(period, [])
+
+    # rooms that can host each teaching: not smaller than the teaching and at most max_room_size bigger
+    def build_room_compatibility(self, max_room_size):
+        rooms_by_size = {}
+        for room in self.room_classes:
+            rooms_by_size.setdefault(room.size, []).append(room)
+
+        self.room_compatibility = {}
+        self.room_compatibility_reverse = {room.name: [] for room in self.room_classes}
+        for teaching in self.teaching_classes:
+            rooms = [
+                room
+                for size in range(teaching.size, teaching.size + max_room_size + 1)
+                for room in rooms_by_size.get(size, [])
+            ]
+            self.room_compatibility[teaching.name] = rooms
+            for room in rooms:
+                self.room_compatibility_reverse[room.name].append(teaching)
+        return self.room_compatibility
+
+    # interchangeable rooms: same campus and room_size, {(campus, room_size): rooms}
+    def build_room_types(self):
+        self.room_types = {}
+        for room in self.room_classes:
+            self.room_types.setdefault((room.campus, room.size), []).append(room)
+        return self.room_types
+
+    def get_rooms_by_teaching(self, teaching_name):
+        return self.room_compatibility.get(teaching_name, [])
+
+    def get_teachings_by_room(self, room_name):
+        return self.room_compatibility_reverse.get(room_name, [])
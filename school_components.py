@@ -0,0 +1,166 @@
+import copy
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+import school_heuristic as heu
+import school_lns as lns
+import school_model as mod
+import school_output as out
+import school_rooms as rms
+import school_solver as sol
+import school_warmstart as wst
+
+
+# ------------------------------------Components------------------------------------
+# teachings tied by a course or a teacher end up in the same component; rooms are shared
+# by every teaching (any two compatible room sets overlap somewhere), so they are left
+# out here and matched on the merged timetable. Largest component first
+def components(school):
+    parent = {}
+
+    def find(node):
+        while parent.setdefault(node, node) != node:
+            parent[node] = parent[parent[node]]
+            node = parent[node]
+        return node
+
+    for course in school.course_classes:
+        for teaching in course.teachings:
+            parent[find(("teaching", teaching.name))] = find(("course", course.name))
+    for teaching in school.teaching_classes:
+        parent[find(("teaching", teaching.name))] = find(("teacher", teaching.teacher))
+
+    parts = {}
+    for teaching in school.teaching_classes:
+        parts.setdefault(find(("teaching", teaching.name)), []).append(teaching.name)
+    return sorted(parts.values(), key=len, reverse=True)
+
+
+# components packed into at most n jobs of similar size (largest first into the smallest job)
+def pack(parts, n):
+    jobs = [[] for _ in range(max(1, min(n, len(parts))))]
+    for part in parts:
+        min(jobs, key=len).extend(part)
+    return [job for job in jobs if job]
+
+
+# copy of school with only the given teachings and their courses and teachers (a
+# component, so no course or teacher loses a teaching); rooms and calendar are kept
+def sub_school(school, teachings):
+    teachings = set(teachings)
+    school = copy.deepcopy(school)
+    school.filter_by("teaching_classes", "name", teachings)
+    school.filter_by(
+        "course_classes",
+        "name",
+        set(c.name for c in school.course_classes if any(t.name in teachings for t in c.teachings)),
+    )
+    school.filter_by("teacher_classes", "name", set(t.teacher for t in school.teaching_classes))
+    return school
+
+
+# ------------------------------------Sub-solve------------------------------------
+# build and solve the model of one job (see school_model.build_model, rooms="matching");
+# prof_cost is the cost of the whole school, whose noise is drawn per teacher of the whole
+# school, and overrides the one the sub school would draw
+def solve_component(school, teachings, parameters, profiles, prof_cost, config, seed=0):
+    teacher_ids = {teacher.name: teacher.id for teacher in school.teacher_classes}
+    school = sub_school(school, teachings)
+    model, sets = mod.build_model(school, parameters, profiles, "matching", seed, presolve=True)
+    columns = school.get_columns()
+    for i, day in enumerate(columns["calendar_days"]):
+        for j, hour in enumerate(columns["calendar_hours"]):
+            for teacher in school.teacher_classes:
+                model.prof_cost[int(day), int(hour), teacher.name] = float(
+                    prof_cost[i, j, teacher_ids[teacher.name]]
+                )
+    result = sol.solve(model, config)
+    solution = out.extract_solution(model) if result.has_solution() else None
+    return solution, result
+
+
+# ------------------------------------Reconcile------------------------------------
+# the components compete for the same rooms: re-solve the whole school in the matching
+# mode with every lecture fixed to the merged timetable except those of the teachings left
+# without a room (or of a job without a solution) and of the teachings sharing a course or
+# a teacher with them, see school_lns.fix_outside
+def reconcile(solution, school, parameters, profiles, config, seed=0):
+    placed = set(solution["teaching"])
+    teachings = set(solution.loc[solution["room"].isna(), "teaching"])
+    teachings |= set(t.name for t in school.teaching_classes if t.name not in placed)
+    free = set(teachings)
+    for name in teachings:
+        teaching = school.teachings_by_name[name]
+        free |= set(t.name for t in school.get_teachings_by_teacher(teaching.teacher))
+    for course in school.course_classes:
+        if any(t.name in teachings for t in course.teachings):
+            free |= set(t.name for t in course.teachings)
+    model, sets = mod.build_model(school, parameters, profiles, "matching", seed, presolve=True)
+    wst.apply_start(model, solution.dropna(subset=["room"]))
+    variables = lns.fix_outside(model, None, free)
+    print(f"Reconcile: {len(teachings)} teachings without a room, {len(free)} teachings and {variables} variables free")
+    result = sol.solve(model, config)
+    lns.unfix_all(model)
+    if not result.has_solution():
+        return solution
+    return rms.assign_rooms(out.extract_solution(model), school, parameters)
+
+
+# ------------------------------------Decomposition------------------------------------
+# split the school into independent components, solve them in parallel processes and merge
+# the timetables; rooms are matched on the merged timetable (see school_rooms.assign_rooms),
+# lectures left without a room, or of a job without a solution, are moved by reconcile and
+# anything still missing is placed by the greedy heuristic. Processes are forked, where fork
+# is not available the jobs run in turn
+def solve_by_components(school, parameters, profiles, prof_cost, config=None, workers=None, seed=0):
+    start = time.perf_counter()
+    config = config if config is not None else sol.SolverConfig()
+    workers = workers if workers is not None else os.cpu_count()
+    if "fork" not in multiprocessing.get_all_start_methods():
+        workers = 1
+    parts = components(school)
+    jobs = pack(parts, workers)
+    sub_config = sol.SolverConfig(
+        config.name,
+        time_limit=config.time_limit,
+        mip_gap=config.mip_gap,
+        threads=max(1, config.threads // len(jobs)),
+        seed=config.seed,
+        executable=config.executable,
+    )
+    print(
+        f"Components: {len(parts)} (largest {len(parts[0])} teachings) in {len(jobs)} jobs "
+        f"on {min(workers, len(jobs))} processes"
+    )
+
+    arguments = [(school, job, parameters, profiles, prof_cost, sub_config, seed) for job in jobs]
+    if workers > 1 and len(jobs) > 1:
+        with ProcessPoolExecutor(len(jobs), mp_context=multiprocessing.get_context("fork")) as pool:
+            outputs = list(pool.map(solve_component, *zip(*arguments)))
+    else:
+        outputs = [solve_component(*job_arguments) for job_arguments in arguments]
+
+    solutions = [solution for solution, result in outputs if solution is not None]
+    results = [result for solution, result in outputs]
+    solution = pd.concat(solutions, ignore_index=True) if solutions else pd.DataFrame(columns=out.SOLUTION_COLUMNS)
+    solution = rms.assign_rooms(solution, school, parameters)
+    if solution["room"].isna().any() or len(solutions) < len(jobs):
+        solution = reconcile(solution, school, parameters, profiles, config, seed)
+
+    lectures = {
+        (row.day, row.hour, row.teaching): row.room
+        for row in solution.drop_duplicates(["day", "hour", "teaching"]).itertuples(index=False)
+    }
+    state, report = wst.repair_lectures(lectures, school, parameters)
+    if state.missing():
+        state, greedy_report = heu.greedy_timetable(school, parameters, prof_cost, state, seed=seed)
+    objective = heu.timetable_cost(state, heu.LectureCost(school, prof_cost))
+    print(
+        f"Components merged: {len(state.lectures)} lectures, {report['conflicting']} placed again, "
+        f"{state.missing()} unplaced, objective {objective:.1f} in {time.perf_counter() - start:.1f}s"
+    )
+    return state.to_solution(), results
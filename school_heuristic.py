@@ -0,0 +1,650 @@
+import copy
+import time
+
+import numpy as np
+import pandas as pd
+
+import school_output as out
+
+
+# ------------------------------------State------------------------------------
+# a (partial) timetable over the School objects with the counters needed to check the
+# model constraints in O(1): lectures are (day, hour, teaching, room) and every
+# place/remove keeps the counters in sync
+class TimetableState:
+    def __init__(self, school, parameters, professor_limit=3):
+        self.school = school
+        self.parameters = parameters
+        self.professor_limit = professor_limit
+        self.slots = sorted(set((c.day, c.hour) for c in school.calendar_classes))
+        self.mandatory = school.get_columns()["teaching_mandatory"].tolist()
+        self.max_rooms = len(school.room_classes) - parameters[3]  # free_rooms_hourly
+        school.build_room_compatibility(parameters[1])
+
+        self.courses_by_teaching = {}
+        for course in school.course_classes:
+            for teaching in course.teachings:
+                self.courses_by_teaching.setdefault(teaching.name, []).append(course)
+        # courses and teachers with 6+ weekly hours need two teachings on every day they
+        # have lectures (student_presence, professor_presence)
+        self.course_presence = set(
+            course.id
+            for course in school.course_classes
+            if sum(t.frequency for t in course.teachings) >= 6
+        )
+        self.teacher_presence = set(
+            teacher.name
+            for teacher in school.teacher_classes
+            if sum(t.frequency for t in teacher.teachings) >= 6
+        )
+
+        self.lectures = {}  # (day, hour, teaching name) -> room
+        self.lectures_count = {}
+        self.teaching_days = set()
+        self.teacher_busy = set()
+        self.teacher_daily = {}
+        self.course_mandatory = {}
+        self.course_elective = {}
+        self.course_daily = {}
+        self.room_busy = set()
+        self.rooms_used = {}
+
+    # mandatory teachings of a course cannot overlap; electives overlap up to
+    # max_elective_overlap, and not at all with a mandatory one in partitioned courses
+    # (see ubiquity_stud)
+    def student_conflict(self, course, day, hour, is_mandatory):
+        n_mandatory = self.course_mandatory.get((course.id, day, hour), 0)
+        n_elective = self.course_elective.get((course.id, day, hour), 0)
+        if is_mandatory:
+            return n_mandatory >= 1 or (course.partition != "NO" and n_elective >= 1)
+        return n_elective >= self.parameters[4] or (course.partition != "NO" and n_mandatory >= 1)
+
+    # True if a lecture of teaching at (day, hour) breaks frequency, repeat_teaching,
+    # professor ubiquity/limit, student ubiquity or free_room (rooms are checked apart)
+    def conflict(self, teaching, day, hour):
+        return (
+            self.lectures_count.get(teaching.name, 0) >= teaching.frequency
+            or (teaching.name, day) in self.teaching_days
+            or (teaching.teacher, day, hour) in self.teacher_busy
+            or self.teacher_daily.get((teaching.teacher, day), 0) >= self.professor_limit
+            or self.rooms_used.get((day, hour), 0) >= self.max_rooms
+            or any(
+                self.student_conflict(course, day, hour, self.mandatory[teaching.id])
+                for course in self.courses_by_teaching.get(teaching.name, [])
+            )
+        )
+
+    # the preferred room if it fits and is free, else the smallest free compatible room
+    def free_room(self, teaching, day, hour, preferred=None):
+        rooms = self.school.get_rooms_by_teaching(teaching.name)
+        for room in rooms:
+            if room.name == preferred and (day, hour, room.name) not in self.room_busy:
+                return room
+        for room in rooms:
+            if (day, hour, room.name) not in self.room_busy:
+                return room
+        return None
+
+    def place(self, teaching, day, hour, room):
+        self.update(teaching, day, hour, room.name, 1)
+        self.lectures[(day, hour, teaching.name)] = room.name
+        self.teaching_days.add((teaching.name, day))
+        self.teacher_busy.add((teaching.teacher, day, hour))
+        self.room_busy.add((day, hour, room.name))
+
+    def remove(self, teaching, day, hour):
+        room_name = self.lectures.pop((day, hour, teaching.name))
+        self.update(teaching, day, hour, room_name, -1)
+        self.teaching_days.discard((teaching.name, day))
+        self.teacher_busy.discard((teaching.teacher, day, hour))
+        self.room_busy.discard((day, hour, room_name))
+        return room_name
+
+    def update(self, teaching, day, hour, room_name, step):
+        self.lectures_count[teaching.name] = self.lectures_count.get(teaching.name, 0) + step
+        key = (teaching.teacher, day)
+        self.teacher_daily[key] = self.teacher_daily.get(key, 0) + step
+        self.rooms_used[(day, hour)] = self.rooms_used.get((day, hour), 0) + step
+        counter = self.course_mandatory if self.mandatory[teaching.id] else self.course_elective
+        for course in self.courses_by_teaching.get(teaching.name, []):
+            counter[(course.id, day, hour)] = counter.get((course.id, day, hour), 0) + step
+            self.course_daily[(course.id, day)] = self.course_daily.get((course.id, day), 0) + step
+
+    # shares the school and the static lookups, copies the timetable and its counters
+    def copy(self):
+        state = copy.copy(self)
+        state.lectures = dict(self.lectures)
+        state.lectures_count = dict(self.lectures_count)
+        state.teaching_days = set(self.teaching_days)
+        state.teacher_busy = set(self.teacher_busy)
+        state.teacher_daily = dict(self.teacher_daily)
+        state.course_mandatory = dict(self.course_mandatory)
+        state.course_elective = dict(self.course_elective)
+        state.course_daily = dict(self.course_daily)
+        state.room_busy = set(self.room_busy)
+        state.rooms_used = dict(self.rooms_used)
+        return state
+
+    # the presence courses and teachers a lecture of teaching counts for
+    def presence_keys(self, teaching):
+        keys = []
+        if teaching.teacher in self.teacher_presence:
+            keys.append(("teacher", teaching.teacher))
+        for course in self.courses_by_teaching.get(teaching.name, []):
+            if course.id in self.course_presence:
+                keys.append(("course", course.id))
+        return keys
+
+    # how many of keys have a single lecture on each of days
+    def lone_count(self, keys, days):
+        count = 0
+        for kind, key in keys:
+            daily = self.teacher_daily if kind == "teacher" else self.course_daily
+            for day in days:
+                if daily.get((key, day), 0) == 1:
+                    count += 1
+        return count
+
+    # how many presence courses and teachers of teaching have a single lecture on day
+    def alone(self, teaching, day):
+        count = 0
+        if teaching.teacher in self.teacher_presence and self.teacher_daily.get((teaching.teacher, day), 0) == 1:
+            count += 1
+        for course in self.courses_by_teaching.get(teaching.name, []):
+            if course.id in self.course_presence and self.course_daily.get((course.id, day), 0) == 1:
+                count += 1
+        return count
+
+    # (course or teacher, day) pairs with a single lecture, for the presence constraints
+    def lone_days(self):
+        return sum(
+            1 for (teacher, day), n in self.teacher_daily.items() if n == 1 and teacher in self.teacher_presence
+        ) + sum(1 for (course, day), n in self.course_daily.items() if n == 1 and course in self.course_presence)
+
+    # lectures left alone on their day by student_presence or professor_presence
+    def presence_violations(self):
+        violations = []
+        for day, hour, teaching_name in self.lectures:
+            teaching = self.school.teachings_by_name[teaching_name]
+            if (
+                teaching.teacher in self.teacher_presence
+                and self.teacher_daily.get((teaching.teacher, day), 0) == 1
+            ) or any(
+                course.id in self.course_presence and self.course_daily.get((course.id, day), 0) == 1
+                for course in self.courses_by_teaching.get(teaching_name, [])
+            ):
+                violations.append((day, hour, teaching))
+        return violations
+
+    def missing(self):
+        return sum(t.frequency for t in self.school.teaching_classes) - len(self.lectures)
+
+    # long-format solution, same columns as school_output.extract_solution
+    def to_solution(self):
+        rows = []
+        for (day, hour, teaching_name), room_name in sorted(self.lectures.items()):
+            teaching = self.school.teachings_by_name[teaching_name]
+            for course in self.courses_by_teaching.get(teaching_name, [None]):
+                rows.append(
+                    dict(
+                        day=day,
+                        hour=hour,
+                        course=course.name if course is not None else None,
+                        teaching=teaching_name,
+                        teacher=teaching.teacher,
+                        room=room_name,
+                    )
+                )
+        return pd.DataFrame(rows, columns=out.SOLUTION_COLUMNS)
+
+
+# ------------------------------------Costs------------------------------------
+# objective contribution of one lecture per (day, hour): prof_cost of its teacher plus
+# cal_cost once per course pair, as in model_objective
+class LectureCost:
+    def __init__(self, school, prof_cost):
+        columns = school.get_columns()
+        self.day_ids = {int(day): i for i, day in enumerate(columns["calendar_days"])}
+        self.hour_ids = {int(hour): i for i, hour in enumerate(columns["calendar_hours"])}
+        self.cal_cost = columns["calendar_cost"]
+        self.prof_cost = prof_cost
+        self.teacher_ids = {teacher.name: teacher.id for teacher in school.teacher_classes}
+
+    def __call__(self, teaching, n_courses, day, hour):
+        i, j = self.day_ids[day], self.hour_ids[hour]
+        cost = self.cal_cost[i, j] * n_courses
+        teacher = self.teacher_ids.get(teaching.teacher)
+        if teacher is not None:
+            cost += self.prof_cost[i, j, teacher]
+        return float(cost)
+
+
+# ------------------------------------Presence repair------------------------------------
+# take out every lecture of the given teachings and put them back one by one in the
+# conflict-free slot that leaves the fewest (course or teacher, day) with a single lecture,
+# cheapest first; the change is kept only if the total of lone days goes down
+def reinsert(state, cost, teachings):
+    presence = list(dict.fromkeys(key for teaching in teachings for key in state.presence_keys(teaching)))
+    days = sorted(set(day for day, hour in state.slots))
+    before = state.lone_count(presence, days)
+    lectures = [
+        (teaching, d, h)
+        for teaching in teachings
+        for d, h in state.slots
+        if (d, h, teaching.name) in state.lectures
+    ]
+    lectures = [(teaching, d, h, state.remove(teaching, d, h)) for teaching, d, h in lectures]
+    placed = []
+    for teaching, d0, h0, room_name in lectures:
+        n_courses = len(state.courses_by_teaching.get(teaching.name, []))
+        best = None
+        for d1, h1 in state.slots:
+            if state.conflict(teaching, d1, h1):
+                continue
+            room = state.free_room(teaching, d1, h1)
+            if room is None:
+                continue
+            alone_before = state.alone(teaching, d1)
+            state.place(teaching, d1, h1, room)
+            key = (state.alone(teaching, d1) - alone_before, cost(teaching, n_courses, d1, h1))
+            state.remove(teaching, d1, h1)
+            if best is None or key < best[0]:
+                best = (key, d1, h1, room)
+        if best is None:
+            break
+        state.place(teaching, best[1], best[2], best[3])
+        placed.append((teaching, best[1], best[2]))
+
+    if len(placed) == len(lectures) and state.lone_count(presence, days) < before:
+        return True
+    for teaching, d, h in placed:
+        state.remove(teaching, d, h)
+    for teaching, d, h, room_name in lectures:
+        state.place(teaching, d, h, state.free_room(teaching, d, h, room_name))
+    return False
+
+
+# local search on the lectures left alone: reinsert the lone teaching, each teaching of
+# the same teacher or course, then the lone teaching together with each of them, until
+# no lone day can be removed
+def repair_presence(state, cost, max_rounds=5):
+    school = state.school
+    for _ in range(max_rounds):
+        improved = False
+        for day, hour, teaching in state.presence_violations():
+            if (day, hour, teaching.name) not in state.lectures or not state.alone(teaching, day):
+                continue
+            related = {teaching.name: teaching}
+            for other in school.get_teachings_by_teacher(teaching.teacher):
+                related[other.name] = other
+            for course in state.courses_by_teaching.get(teaching.name, []):
+                for other in course.teachings:
+                    related[other.name] = other
+            related.pop(teaching.name)
+            related = list(related.values())
+            moves = [[teaching]] + [[other] for other in related] + [[teaching, other] for other in related]
+            for move in moves:
+                if reinsert(state, cost, move):
+                    improved = True
+                    break
+        if not improved:
+            break
+
+
+# ------------------------------------Greedy------------------------------------
+# hardest teachings first (biggest size, busiest teacher, fewest rooms), visiting the
+# teachings tied by a presence course or teacher one after the other so that each one
+# can join the days of those already placed; rng shuffles the ties between restarts
+def greedy_order(state, rng=None):
+    school = state.school
+    teacher_load = {
+        teacher.name: sum(t.frequency for t in teacher.teachings) for teacher in school.teacher_classes
+    }
+    noise = rng.random(len(school.teaching_classes)) if rng is not None else np.zeros(len(school.teaching_classes))
+    hardest = sorted(
+        school.teaching_classes,
+        key=lambda t: (
+            -t.size,
+            -teacher_load.get(t.teacher, 0),
+            len(school.get_rooms_by_teaching(t.name)),
+            noise[t.id],
+            t.id,
+        ),
+    )
+    rank = {teaching.name: i for i, teaching in enumerate(hardest)}
+
+    def neighbors(teaching):
+        tied = []
+        if teaching.teacher in state.teacher_presence:
+            tied += school.get_teachings_by_teacher(teaching.teacher)
+        for course in state.courses_by_teaching.get(teaching.name, []):
+            if course.id in state.course_presence:
+                tied += course.teachings
+        return sorted(tied, key=lambda t: rank[t.name])
+
+    order = []
+    visited = set()
+    for first in hardest:
+        if first.name in visited:
+            continue
+        visited.add(first.name)
+        queue = [first]
+        while queue:
+            teaching = queue.pop(0)
+            order.append(teaching)
+            for other in neighbors(teaching):
+                if other.name not in visited:
+                    visited.add(other.name)
+                    queue.append(other)
+    return order
+
+
+# place the missing lectures of every teaching in order, each in the cheapest
+# conflict-free (day, hour) with the smallest free room; days that would leave a lecture
+# alone for student/professor presence are penalized, rng perturbs the slot costs
+def construct(state, cost, order, rng=None, presence_penalty=100.0, noise=0.2):
+    def score(teaching, day, hour):
+        courses = state.courses_by_teaching.get(teaching.name, [])
+        value = cost(teaching, len(courses), day, hour)
+        if teaching.teacher in state.teacher_presence and state.teacher_daily.get((teaching.teacher, day), 0) == 0:
+            value += presence_penalty
+        for course in courses:
+            if course.id in state.course_presence and state.course_daily.get((course.id, day), 0) == 0:
+                value += presence_penalty
+        if rng is not None:
+            value *= 1 + noise * rng.random()
+        return value
+
+    for teaching in order:
+        while state.lectures_count.get(teaching.name, 0) < teaching.frequency:
+            candidates = sorted(
+                (score(teaching, day, hour), day, hour)
+                for day, hour in state.slots
+                if not state.conflict(teaching, day, hour)
+            )
+            slot = None
+            for value, day, hour in candidates:
+                room = state.free_room(teaching, day, hour)
+                if room is not None:
+                    slot = (day, hour, room)
+                    break
+            if slot is None:
+                break
+            state.place(teaching, *slot)
+
+
+def timetable_cost(state, cost):
+    return sum(
+        cost(
+            state.school.teachings_by_name[teaching_name],
+            len(state.courses_by_teaching.get(teaching_name, [])),
+            day,
+            hour,
+        )
+        for day, hour, teaching_name in state.lectures
+    )
+
+
+# complete state (or build a timetable from scratch) with construct + repair_presence;
+# the first run is deterministic, the next ones restart from state with shuffled ties
+# and noisy costs until every lecture is placed with no presence violation (or until the
+# next restart would end past time_limit), keeping the best (fewest missing, fewest
+# violations, cheapest) timetable
+def greedy_timetable(
+    school, parameters, prof_cost, state=None, restarts=10, time_limit=None, seed=0, presence_penalty=100.0
+):
+    start = time.perf_counter()
+    state = state if state is not None else TimetableState(school, parameters)
+    cost = LectureCost(school, prof_cost)
+    best = None
+    for restart in range(restarts):
+        rng = np.random.default_rng([seed, restart]) if restart > 0 else None
+        trial = state.copy()
+        construct(trial, cost, greedy_order(trial, rng), rng, presence_penalty)
+        repair_presence(trial, cost)
+        key = (trial.missing(), len(trial.presence_violations()), timetable_cost(trial, cost))
+        if best is None or key < best[0]:
+            best = (key, trial, restart)
+        if key[:2] == (0, 0):
+            break
+        # no restart that would end past time_limit, a restart taking about the mean so far
+        elapsed = time.perf_counter() - start
+        if time_limit is not None and elapsed * (restart + 2) / (restart + 1) > time_limit:
+            break
+
+    (missing, violations, objective), state, restart = best
+    report = dict(
+        placed=len(state.lectures),
+        unplaced=missing,
+        presence_violations=violations,
+        objective=objective,
+        restarts=restart + 1,
+        wall_time=time.perf_counter() - start,
+    )
+    print(
+        f"Greedy timetable: {report['placed']} lectures placed, {report['unplaced']} unplaced, "
+        f"{report['presence_violations']} presence violations, objective {report['objective']:.1f} "
+        f"(restart {report['restarts']}) in {report['wall_time']:.2f}s"
+    )
+    return state, report
+
+
+# ------------------------------------Local search------------------------------------
+# simulated annealing over a timetable. Every move shifts a few lectures: relocate one,
+# swap the slots of two, swap two days of a group of lectures tied by presence or
+# insert a missing one. Moves never break the constraints checked by
+# TimetableState.conflict; lone presence days and missing lectures are penalized. A move
+# is priced by its delta (prof_cost + cal_cost of the lectures it shifts, penalties on
+# the days it touches) and accepted with the Metropolis rule, cooling geometrically
+# from t_start to t_end
+def anneal(
+    school,
+    parameters,
+    prof_cost,
+    state=None,
+    iterations=200000,
+    time_limit=None,
+    seed=0,
+    t_start=1.0,
+    t_end=0.01,
+    presence_penalty=(10.0, 10000.0),
+    missing_penalty=10000.0,
+    max_chain=40,
+):
+    start = time.perf_counter()
+    if state is None:
+        state, greedy_report = greedy_timetable(school, parameters, prof_cost, seed=seed)
+    state = state.copy()
+    cost = LectureCost(school, prof_cost)
+    rng = np.random.default_rng(seed)
+    n_courses = {t.name: len(state.courses_by_teaching.get(t.name, [])) for t in school.teaching_classes}
+
+    # lectures in a list for O(1) random picks, kept in sync with state.lectures
+    keys = list(state.lectures)
+    positions = {key: i for i, key in enumerate(keys)}
+
+    def lecture_cost(teaching, day, hour):
+        return cost(teaching, n_courses[teaching.name], day, hour)
+
+    # moves: [(teaching, (day, hour) or None to insert, (day, hour))]; applies them and
+    # returns the change of (cost, lone days, missing lectures) and an undo, or None
+    # (state unchanged) if a lecture does not fit
+    def shift(moves):
+        days = set(slot[0] for teaching, old, new in moves for slot in (old, new) if slot is not None)
+        presence = list(
+            dict.fromkeys(key for teaching, old, new in moves for key in state.presence_keys(teaching))
+        )
+        delta = np.array([0.0, -state.lone_count(presence, days), 0.0])
+        removed = []
+        for teaching, old, new in moves:
+            if old is not None:
+                removed.append((teaching, old, state.remove(teaching, *old)))
+                delta[0] -= lecture_cost(teaching, *old)
+            else:
+                delta[2] -= 1
+
+        placed = []
+        for teaching, old, new in moves:
+            room = None if state.conflict(teaching, *new) else state.free_room(
+                teaching, *new, dict(((t.name, o), r) for t, o, r in removed).get((teaching.name, old))
+            )
+            if room is None:
+                for teaching, slot in placed:
+                    state.remove(teaching, *slot)
+                for teaching, old, room_name in removed:
+                    state.place(teaching, *old, state.free_room(teaching, *old, room_name))
+                return None
+            state.place(teaching, *new, room)
+            placed.append((teaching, new))
+            delta[0] += lecture_cost(teaching, *new)
+        delta[1] += state.lone_count(presence, days)
+
+        def undo():
+            for teaching, slot in placed:
+                state.remove(teaching, *slot)
+            for teaching, old, room_name in removed:
+                state.place(teaching, *old, state.free_room(teaching, *old, room_name))
+
+        return delta, undo
+
+    def random_lecture():
+        day, hour, name = keys[rng.integers(len(keys))]
+        return school.teachings_by_name[name], (day, hour)
+
+    def random_slot():
+        return state.slots[rng.integers(len(state.slots))]
+
+    def relocate():
+        teaching, old = random_lecture()
+        new = random_slot()
+        return [(teaching, old, new)] if new != old else None
+
+    def swap():
+        (t0, s0), (t1, s1) = random_lecture(), random_lecture()
+        return [(t0, s0, s1), (t1, s1, s0)] if s0 != s1 and t0 is not t1 else None
+
+    # swap two days for a lecture and every lecture tied to it on those days through a
+    # presence course or teacher (up to max_chain lectures): the presence of everything
+    # moved is unchanged
+    def swap_days():
+        teaching, (d0, h0) = random_lecture()
+        d1 = random_slot()[0]
+        if d1 == d0:
+            return None
+        hours = sorted(set(hour for day, hour in state.slots))
+        moves = []
+        visited = {teaching.name}
+        queue = [teaching]
+        while queue:
+            teaching = queue.pop()
+            lectures = [
+                (day, hour)
+                for day in (d0, d1)
+                for hour in hours
+                if (day, hour, teaching.name) in state.lectures
+            ]
+            for day, hour in lectures:
+                moves.append((teaching, (day, hour), (d1 if day == d0 else d0, hour)))
+            if len(moves) > max_chain:
+                return None
+            if not lectures:
+                continue
+            tied = []
+            if teaching.teacher in state.teacher_presence:
+                tied += school.get_teachings_by_teacher(teaching.teacher)
+            for course in state.courses_by_teaching.get(teaching.name, []):
+                if course.id in state.course_presence:
+                    tied += course.teachings
+            for other in tied:
+                if other.name not in visited:
+                    visited.add(other.name)
+                    queue.append(other)
+        return moves
+
+    missing = [t for t in school.teaching_classes if state.lectures_count.get(t.name, 0) < t.frequency]
+
+    def insert():
+        return [(missing[rng.integers(len(missing))], None, random_slot())]
+
+    def propose():
+        draw = rng.random()
+        if missing and draw < 0.05:
+            return insert()
+        if not keys:
+            return None
+        if draw < 0.5:
+            return relocate()
+        if draw < 0.85:
+            return swap()
+        return swap_days()
+
+    # the presence penalty grows from its first to its last value during the first half of
+    # the run: lone days are cheap early, which lets groups of lectures change day one at a
+    # time, and priced out for the second half. The best timetable is ranked as in
+    # greedy_timetable (fewest missing lectures, fewest lone days, cheapest), so it is never
+    # less feasible than the start
+    presence_start, presence_end = presence_penalty
+    current = np.array([timetable_cost(state, cost), state.lone_days(), state.missing()])
+
+    def rank(values):
+        return (round(values[2]), round(values[1]), round(values[0], 6))
+
+    best = (rank(current), state.copy())
+    accepted = 0
+    iteration = 0
+    for iteration in range(iterations):
+        if time_limit is not None and iteration % 1000 == 0 and time.perf_counter() - start > time_limit:
+            break
+        progress = iteration / iterations
+        temperature = t_start * (t_end / t_start) ** progress
+        ramp = min(1.0, 2 * progress)
+        weights = np.array([1.0, presence_start * (presence_end / presence_start) ** ramp, missing_penalty])
+        moves = propose()
+        move = shift(moves) if moves else None
+        if move is None:
+            continue
+        delta, undo = move
+        value = delta @ weights
+        if value <= 0 or rng.random() < np.exp(-value / temperature):
+            for teaching, old, new in moves:
+                if old is not None:
+                    key = (*old, teaching.name)
+                    i = positions.pop(key)
+                    last = keys.pop()
+                    if i < len(keys):
+                        keys[i] = last
+                        positions[last] = i
+            for teaching, old, new in moves:
+                positions[(*new, teaching.name)] = len(keys)
+                keys.append((*new, teaching.name))
+                if old is None and state.lectures_count[teaching.name] == teaching.frequency:
+                    missing.remove(teaching)
+            current += delta
+            accepted += 1
+        else:
+            undo()
+        if iteration % 1000 == 999 and rank(current) < best[0]:
+            best = (rank(current), state.copy())
+    # lone days left at the end often go with a reinsertion (see repair_presence)
+    repair_presence(state, cost)
+    current = np.array([timetable_cost(state, cost), state.lone_days(), state.missing()])
+    if rank(current) < best[0]:
+        best = (rank(current), state)
+
+    state = best[1]
+    report = dict(
+        placed=len(state.lectures),
+        unplaced=state.missing(),
+        presence_violations=len(state.presence_violations()),
+        lone_days=state.lone_days(),
+        objective=timetable_cost(state, cost),
+        iterations=iteration + 1,
+        accepted=accepted,
+        wall_time=time.perf_counter() - start,
+    )
+    print(
+        f"Annealing: objective {report['objective']:.1f}, {report['unplaced']} unplaced, "
+        f"{report['presence_violations']} presence violations, {report['accepted']} of "
+        f"{report['iterations']} moves accepted in {report['wall_time']:.2f}s"
+    )
+    return state, report
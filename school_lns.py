@@ -0,0 +1,172 @@
+import time
+
+import numpy as np
+import pyomo.environ as pyo
+
+import school_solver as sol
+
+
+NEIGHBORHOODS = ("day", "year", "teacher", "campus")
+
+
+# ------------------------------------Neighborhoods------------------------------------
+# position of the teaching in the index of x (day, hour, course, teaching), y and y_free
+# (day, hour, teacher, teaching), z (day, hour, teaching, room) and w (day, hour, teaching,
+# campus, size)
+TEACHING_POSITION = {"x": 3, "y": 3, "y_free": 3, "z": 2, "w": 2}
+
+
+# the variables of the model by name: z is missing in the two-stage mode, w is only in the
+# room types mode, y is an expression after a presolve (see school_model.substitute_y)
+def model_variables(model):
+    return {
+        name: model.component(name)
+        for name in TEACHING_POSITION
+        if model.component(name) is not None and model.component(name).ctype is pyo.Var
+    }
+
+
+# teachers reached from teacher through shared courses, breadth first, up to size
+def teacher_cluster(school, teacher, size):
+    cluster = {teacher.name: teacher}
+    queue = [teacher]
+    while queue and len(cluster) < size:
+        current = queue.pop(0)
+        for course_name in current.courses:
+            for other in school.get_teachers_by_course(course_name):
+                if other.name not in cluster and len(cluster) < size:
+                    cluster[other.name] = other
+                    queue.append(other)
+    return list(cluster.values())
+
+
+# (label, free day or None, free teaching names or None) of a random neighborhood of kind
+def neighborhood(school, kind, rng, cluster_size=8):
+    if kind == "day":
+        days = sorted(set(c.day for c in school.calendar_classes))
+        day = days[rng.integers(len(days))]
+        return f"day {day}", day, None
+    if kind == "year":
+        years = sorted(set(c.year for c in school.course_classes))
+        year = years[rng.integers(len(years))]
+        teachings = set(t.name for c in school.course_classes if c.year == year for t in c.teachings)
+        return f"year {year}", None, teachings
+    if kind == "teacher":
+        teacher = school.teacher_classes[rng.integers(len(school.teacher_classes))]
+        cluster = teacher_cluster(school, teacher, cluster_size)
+        teachings = set(t.name for other in cluster for t in other.teachings)
+        return f"teachers of {teacher.name} ({len(cluster)})", None, teachings
+    if kind == "campus":
+        campuses = sorted(set(t.campus for t in school.teaching_classes))
+        campus = campuses[rng.integers(len(campuses))]
+        return f"campus {campus}", None, set(t.name for t in school.get_teachings_by_campus(campus))
+    raise ValueError(f"Unknown neighborhood {kind!r}, choose one of: {', '.join(NEIGHBORHOODS)}")
+
+
+# fix every x, y, z outside the neighborhood to its current value, free the others;
+# returns the number of free variables
+def fix_outside(model, day, teachings):
+    free = 0
+    for name, variable in model_variables(model).items():
+        position = TEACHING_POSITION[name]
+        for index, var in variable.items():
+            if (day is not None and index[0] == day) or (teachings is not None and index[position] in teachings):
+                var.unfix()
+                free += 1
+            else:
+                var.fix(round(var.value) if var.value is not None else 0)
+    return free
+
+
+def unfix_all(model):
+    for variable in model_variables(model).values():
+        for var in variable.values():
+            var.unfix()
+
+
+def current_values(model):
+    return {name: variable.extract_values() for name, variable in model_variables(model).items()}
+
+
+def restore_values(model, values):
+    for name, var_values in values.items():
+        var = getattr(model, name)
+        for index, value in var_values.items():
+            var[index].set_value(value)
+
+
+# names of the active rows the current values violate (at most limit of them), an empty
+# list for a feasible timetable
+def violated_rows(model, tolerance=1e-6, limit=10):
+    violated = []
+    for row in model.component_data_objects(pyo.Constraint, active=True):
+        value = pyo.value(row.body, exception=False)
+        if value is None or (row.has_lb() and value < pyo.value(row.lower) - tolerance) or (
+            row.has_ub() and value > pyo.value(row.upper) + tolerance
+        ):
+            violated.append(row.name)
+            if len(violated) == limit:
+                break
+    return violated
+
+
+# ------------------------------------LNS------------------------------------
+# large neighborhood search around a built model holding a feasible timetable (see
+# school_warmstart.apply_start): each step fixes x, y and z outside a neighborhood to
+# the incumbent and re-solves the small sub-MIP warm started from it, keeping any
+# improvement; neighborhoods cycle through kinds, each picked at random
+def lns(
+    model,
+    school,
+    config=None,
+    iterations=50,
+    time_limit=600,
+    sub_time_limit=30,
+    kinds=NEIGHBORHOODS,
+    seed=0,
+    cluster_size=8,
+):
+    if any(var.value is None for var in model.x.values()):
+        raise ValueError("lns needs a timetable in the model, see school_warmstart.apply_start")
+    # every sub-MIP keeps the rest of the incumbent, which must be feasible
+    violated = violated_rows(model)
+    if violated:
+        raise ValueError(f"lns needs a feasible timetable in the model, violated rows: {', '.join(violated)}")
+    start = time.perf_counter()
+    config = config if config is not None else sol.SolverConfig("highs")
+    sub_config = sol.SolverConfig(
+        "highs", time_limit=sub_time_limit, mip_gap=config.mip_gap, threads=config.threads, seed=config.seed
+    )
+    solver = sol.PersistentSolver(model, sub_config, params_only=False)
+    rng = np.random.default_rng(seed)
+    incumbent = pyo.value(model.obj)
+    history = []
+    print(f"LNS start: objective {incumbent:.1f}")
+    for iteration in range(iterations):
+        if time.perf_counter() - start > time_limit:
+            break
+        kind = kinds[iteration % len(kinds)]
+        label, day, teachings = neighborhood(school, kind, rng, cluster_size)
+        free = fix_outside(model, day, teachings)
+        values = current_values(model)
+        result = solver.solve()
+        if result.objective is not None and result.objective < incumbent - 1e-6:
+            incumbent = result.objective
+            improved = True
+        else:
+            restore_values(model, values)
+            improved = False
+        history.append(
+            dict(
+                iteration=iteration,
+                neighborhood=label,
+                free=free,
+                status=result.status,
+                objective=incumbent,
+                improved=improved,
+                wall_time=time.perf_counter() - start,
+            )
+        )
+        print(f"LNS {iteration} ({label}, {free} free): {result.status}, objective {incumbent:.1f}")
+    unfix_all(model)
+    return history
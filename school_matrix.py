@@ -0,0 +1,737 @@
+import time
+
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+
+import school_cache as cache
+import school_model as mod
+import school_output as out
+import school_rooms as rms
+import school_solver as sol
+
+
+# ------------------------------------Matrix model------------------------------------
+# the model of school_model.build_model assembled as a scipy.sparse matrix instead of Pyomo
+# expressions: same variables, objective and constraint families (numbered as there),
+# handed to HiGHS through highspy or written as MPS/LP. Columns are laid out per variable
+# (x, y, z, w), then per slot (day, hour), then per index pair in sorted order, so column
+# names and solution frames are computed from the column number (see column_names and
+# to_solution). Each family is a list of row templates (terms, lower, upper) repeated over
+# every slot, every day or once for the week, with numpy broadcasting. With build=False
+# the matrix is not assembled and the model can only be streamed to an LP file (see
+# write_lp), one family and one chunk of rows at a time
+class MatrixModel:
+    def __init__(self, school, parameters, prof_cost, rooms="rooms", presolve=False, build=True):
+        start = time.perf_counter()
+        self.school = school
+        self.parameters = parameters
+        self.prof_cost = prof_cost
+        self.rooms = rooms
+        self.sets = mod.set_creation(school, parameters)
+        columns = school.get_columns()
+        self.days = [int(day) for day in columns["calendar_days"]]
+        self.hours = [int(hour) for hour in columns["calendar_hours"]]
+        self.n_slots = len(self.days) * len(self.hours)
+        self.presolve = presolve
+        self.substituted = mod.substitute_y(self.sets) if presolve else {}
+
+        self.pairs = dict(
+            x=sorted(self.sets["course_teachings"]),
+            y=sorted(
+                (teacher, teaching)
+                for teacher, teaching in self.sets["teacher_teachings"]
+                if teaching not in self.substituted
+            ),
+            z=sorted(self.sets["teaching_rooms"]) if rooms == "rooms" else [],
+            w=sorted(self.sets["teaching_room_types"]) if rooms == "types" else [],
+        )
+        self.position = {kind: {pair: k for k, pair in enumerate(pairs)} for kind, pairs in self.pairs.items()}
+        self.offset = {}
+        n_cols = 0
+        for kind, pairs in self.pairs.items():
+            self.offset[kind] = n_cols
+            n_cols += self.n_slots * len(pairs)
+        self.n_cols = n_cols
+        if not build:
+            return
+
+        self.rows, self.cols, self.vals = [], [], []
+        self.row_lower, self.row_upper = [], []
+        self.families = []
+        self.n_rows = 0
+        self.build_objective(prof_cost)
+        for name, templates, scope in self.constraint_families():
+            self.add_family(name, templates, scope)
+        # triplets are freed as soon as they are joined, so peak memory stays near twice the matrix
+        rows, self.rows = np.concatenate(self.rows), None
+        cols, self.cols = np.concatenate(self.cols), None
+        vals, self.vals = np.concatenate(self.vals), None
+        self.matrix = sp.coo_matrix((vals, (rows, cols)), shape=(self.n_rows, self.n_cols)).tocsc()
+        del rows, cols, vals
+        self.row_lower = np.concatenate(self.row_lower)
+        self.row_upper = np.concatenate(self.row_upper)
+        self.build_time = time.perf_counter() - start
+        print(
+            f"Matrix model: {self.n_cols} columns, {self.n_rows} rows, {self.matrix.nnz} nonzeros "
+            f"in {self.build_time:.1f}s"
+        )
+
+    # ------------------------------------Terms------------------------------------
+    # (kind, pair position, coefficient); y of a substituted teaching is x of its course
+    def term_x(self, course, teaching, coefficient=1.0):
+        return ("x", self.position["x"][(course, teaching)], coefficient)
+
+    def term_y(self, teacher, teaching, coefficient=1.0):
+        if teaching in self.substituted:
+            return self.term_x(self.substituted[teaching], teaching, coefficient)
+        return ("y", self.position["y"][(teacher, teaching)], coefficient)
+
+    # column numbers of terms over groups of slots: (groups, slots per group, terms)
+    def term_columns(self, kinds, positions, groups):
+        offsets = np.array([self.offset[kind] for kind in kinds], dtype=np.int64)
+        sizes = np.array([len(self.pairs[kind]) for kind in kinds], dtype=np.int64)
+        return offsets[None, None, :] + groups[:, :, None] * sizes[None, None, :] + positions[None, None, :]
+
+    # slot groups a family repeats over: every slot, every day, or the whole week
+    def slot_groups(self, scope):
+        slots = np.arange(self.n_slots, dtype=np.int64).reshape(len(self.days), len(self.hours))
+        if scope == "slot":
+            return slots.reshape(-1, 1)
+        if scope == "day":
+            return slots
+        return slots.reshape(1, -1)
+
+    # terms of the templates of a family flattened: (kinds, positions, coefficients, template
+    # of every term, lower, upper); templates without terms are skipped
+    def family_arrays(self, templates):
+        templates = [template for template in templates if template[0]]
+        kinds = [kind for terms, lower, upper in templates for kind, position, coefficient in terms]
+        positions = np.array(
+            [position for terms, lower, upper in templates for kind, position, coefficient in terms], dtype=np.int64
+        )
+        coefficients = np.array(
+            [coefficient for terms, lower, upper in templates for kind, position, coefficient in terms],
+            dtype=np.float64,
+        )
+        template_ids = np.repeat(np.arange(len(templates)), [len(terms) for terms, lower, upper in templates])
+        lower = np.array([lower for terms, lower, upper in templates], dtype=np.float64)
+        upper = np.array([upper for terms, lower, upper in templates], dtype=np.float64)
+        return kinds, positions, coefficients, template_ids, lower, upper
+
+    # add one family: templates is a list of (terms, lower, upper) and each template gives
+    # one row per slot group
+    def add_family(self, name, templates, scope):
+        kinds, positions, coefficients, template_ids, lower, upper = self.family_arrays(templates)
+        groups = self.slot_groups(scope)
+        first = self.n_rows
+        if len(lower):
+            cols = self.term_columns(kinds, positions, groups)
+            rows = first + np.arange(len(groups))[:, None, None] * len(lower) + template_ids[None, None, :]
+            # int32 indices: half the memory of the default int64
+            self.cols.append(cols.ravel().astype(np.int32))
+            self.rows.append(np.broadcast_to(rows, cols.shape).ravel().astype(np.int32))
+            self.vals.append(np.broadcast_to(coefficients[None, None, :], cols.shape).ravel())
+            self.row_lower.append(np.tile(lower, len(groups)))
+            self.row_upper.append(np.tile(upper, len(groups)))
+            self.n_rows += len(groups) * len(lower)
+        self.families.append((name, first, self.n_rows - first))
+        print(f"{name}: {self.n_rows - first} rows")
+
+    # rows of one family in chunks of about chunk_size nonzeros (one slot group, or a block
+    # of its templates), as (rows as a scipy.sparse CSR matrix over all columns, lower, upper)
+    def family_rows(self, templates, scope, chunk_size=500000):
+        kinds, positions, coefficients, template_ids, lower, upper = self.family_arrays(templates)
+        if not len(lower):
+            return
+        groups = self.slot_groups(scope)
+        # terms before every template, blocks of templates cut at multiples of chunk_size
+        starts = np.concatenate([[0], np.cumsum(np.bincount(template_ids, minlength=len(lower)))])
+        blocks = np.flatnonzero(np.diff(starts[:-1] * groups.shape[1] // chunk_size, prepend=-1))
+        blocks = np.append(blocks, len(lower))
+        for group in groups:
+            for first, last in zip(blocks[:-1], blocks[1:]):
+                terms = slice(starts[first], starts[last])
+                cols = self.term_columns(kinds[terms], positions[terms], group[None, :])
+                rows = np.broadcast_to(template_ids[terms] - first, cols.shape)
+                matrix = sp.csr_matrix(
+                    (np.broadcast_to(coefficients[terms], cols.shape).ravel(), (rows.ravel(), cols.ravel())),
+                    shape=(last - first, self.n_cols),
+                )
+                yield matrix, lower[first:last], upper[first:last]
+
+    # ------------------------------------Objective------------------------------------
+    # prof_cost[day, hour, teacher] * y + cal_cost[day, hour] * x, see model_objective
+    def build_objective(self, prof_cost):
+        self.cost = np.zeros(self.n_cols)
+        for slot in range(self.n_slots):
+            cols, costs = self.slot_cost(prof_cost, slot)
+            self.cost[cols] = costs
+
+    # (columns, costs) of the nonzero costs of one slot
+    def slot_cost(self, prof_cost, slot):
+        columns = self.school.get_columns()
+        teacher_ids = {teacher.name: teacher.id for teacher in self.school.teacher_classes}
+        slots = np.array([[slot]], dtype=np.int64)
+        x = np.arange(len(self.pairs["x"]), dtype=np.int64)
+        cols = [self.term_columns(["x"] * len(x), x, slots).ravel()]
+        costs = [np.full(len(x), columns["calendar_cost"].reshape(-1)[slot], dtype=np.float64)]
+        terms = [
+            self.term_y(teacher.name, teaching.name)
+            for teacher in self.school.teacher_classes
+            for teaching in teacher.teachings
+        ]
+        cols.append(
+            self.term_columns(
+                [kind for kind, position, coefficient in terms],
+                np.array([position for kind, position, coefficient in terms], dtype=np.int64),
+                slots,
+            ).ravel()
+        )
+        costs.append(
+            np.array(
+                [
+                    prof_cost[:, :, teacher_ids[teacher.name]].reshape(-1)[slot]
+                    for teacher in self.school.teacher_classes
+                    for teaching in teacher.teachings
+                ],
+                dtype=np.float64,
+            )
+        )
+        cols, index = np.unique(np.concatenate(cols), return_inverse=True)
+        costs = np.bincount(index, weights=np.concatenate(costs), minlength=len(cols))
+        return cols[costs != 0], costs[costs != 0]
+
+    # ------------------------------------Constraints------------------------------------
+    # (name, templates, scope) of every family in turn, the templates of a family are only
+    # built when it is reached
+    def constraint_families(self):
+        school, parameters = self.school, self.parameters
+        # columns as lists: read per teaching while the templates are built
+        frequency = school.get_columns()["teaching_frequency"].tolist()
+        mandatory = school.get_columns()["teaching_mandatory"].tolist()
+        course_teachings = [(course, teaching) for course in school.course_classes for teaching in course.teachings]
+        teachers_by_teaching = {}
+        for teacher, teaching in self.sets["teacher_teachings"]:
+            teachers_by_teaching.setdefault(teaching, []).append(teacher)
+
+        # 1. and 2. all lectures assigned, for courses and (not substituted) teachers
+        yield (
+            "1. all_courses",
+            [
+                ([self.term_x(course.name, teaching.name)], frequency[teaching.id], frequency[teaching.id])
+                for course, teaching in course_teachings
+            ],
+            "week",
+        )
+        yield (
+            "2. all_teachers",
+            [
+                ([self.term_y(teacher.name, teaching.name)], frequency[teaching.id], frequency[teaching.id])
+                for teacher in school.teacher_classes
+                for teaching in teacher.teachings
+                if teaching.name not in self.substituted
+            ],
+            "week",
+        )
+        if self.rooms == "rooms" and not self.presolve:
+            yield (
+                "3. all_rooms",
+                [
+                    (
+                        [("z", self.position["z"][(teaching.name, room.name)], 1.0) for room in school.get_rooms_by_teaching(teaching.name)],
+                        frequency[teaching.id],
+                        frequency[teaching.id],
+                    )
+                    for course, teaching in course_teachings
+                ],
+                "week",
+            )
+            yield (
+                "4. room_size",
+                [
+                    (
+                        [
+                            ("z", self.position["z"][(teaching.name, room.name)], 1.0),
+                            self.term_x(course.name, teaching.name, -1.0),
+                        ],
+                        -np.inf,
+                        0.0,
+                    )
+                    for course, teaching in course_teachings
+                    for room in school.get_rooms_by_teaching(teaching.name)
+                ],
+                "slot",
+            )
+
+        # 5. student ubiquity: one mandatory and one elective row per course, see ubiquity_stud
+        templates = []
+        for course in school.course_classes:
+            mandatory_terms = [self.term_x(course.name, t.name) for t in course.teachings if mandatory[t.id]]
+            elective_terms = [self.term_x(course.name, t.name) for t in course.teachings if not mandatory[t.id]]
+            templates.append((mandatory_terms, -np.inf, 1.0))
+            if course.partition == "NO":
+                templates.append((elective_terms, -np.inf, parameters[4]))
+            elif elective_terms:
+                mandatory_weighted = [(kind, position, parameters[4]) for kind, position, c in mandatory_terms]
+                templates.append((elective_terms + mandatory_weighted, -np.inf, parameters[4]))
+        yield "5. ubiquity_stud", templates, "slot"
+
+        # 6. professor ubiquity
+        yield (
+            "6. ubiquity_professor",
+            [
+                ([self.term_y(teacher.name, t.name) for t in teacher.teachings], -np.inf, 1.0)
+                for teacher in school.teacher_classes
+            ],
+            "slot",
+        )
+
+        if self.rooms == "rooms":
+            # 7. one lecture per room, 8. link z and x
+            yield (
+                "7. ubiquity_rooms",
+                [
+                    (
+                        [("z", self.position["z"][(t.name, room.name)], 1.0) for t in school.get_teachings_by_room(room.name)],
+                        -np.inf,
+                        1.0,
+                    )
+                    for room in school.room_classes
+                ],
+                "slot",
+            )
+            yield (
+                "8. link_z_x",
+                [
+                    (
+                        [("z", self.position["z"][(teaching.name, room.name)], 1.0) for room in school.get_rooms_by_teaching(teaching.name)]
+                        + [self.term_x(course.name, teaching.name, -1.0)],
+                        0.0,
+                        0.0,
+                    )
+                    for course, teaching in course_teachings
+                ],
+                "slot",
+            )
+        elif self.rooms == "types":
+            # 17. room type capacity and free rooms, 18. link w and x
+            teachings_by_type = {}
+            for teaching, campus, size in self.pairs["w"]:
+                teachings_by_type.setdefault((campus, size), []).append(teaching)
+            yield (
+                "17. ubiquity_room_types",
+                [
+                    (
+                        [("w", self.position["w"][(teaching, campus, size)], 1.0) for teaching in teachings],
+                        -np.inf,
+                        len(school.room_types[(campus, size)]),
+                    )
+                    for (campus, size), teachings in teachings_by_type.items()
+                ]
+                + [
+                    (
+                        [("w", k, 1.0) for k in range(len(self.pairs["w"]))],
+                        -np.inf,
+                        len(self.sets["rooms"]) - parameters[3],
+                    )
+                ],
+                "slot",
+            )
+            types_by_teaching = {}
+            for teaching, campus, size in self.pairs["w"]:
+                types_by_teaching.setdefault(teaching, []).append((campus, size))
+            yield (
+                "18. link_w_x",
+                [
+                    (
+                        [
+                            ("w", self.position["w"][(teaching.name, campus, size)], 1.0)
+                            for campus, size in types_by_teaching.get(teaching.name, [])
+                        ]
+                        + [self.term_x(course.name, teaching.name, -1.0)],
+                        0.0,
+                        0.0,
+                    )
+                    for course, teaching in course_teachings
+                ],
+                "slot",
+            )
+
+        # 9. link y and x (the substituted row for the first course is always true)
+        yield (
+            "9. link_y_x",
+            [
+                (
+                    [self.term_y(teacher, teaching.name) for teacher in teachers_by_teaching.get(teaching.name, [])]
+                    + [self.term_x(course.name, teaching.name, -1.0)],
+                    0.0,
+                    0.0,
+                )
+                for course, teaching in course_teachings
+                if self.substituted.get(teaching.name) != course.name
+            ],
+            "slot",
+        )
+
+        # 10. one lecture of a teaching per day
+        yield (
+            "10. repeat_teaching",
+            [([self.term_x(course.name, teaching.name)], -np.inf, 1.0) for course, teaching in course_teachings],
+            "day",
+        )
+
+        # 11. and 12. presence of courses and teachers with 6 or more weekly hours
+        templates = []
+        for course, lectures in zip(school.course_classes, mod.weekly_lectures(school, school.course_classes)):
+            if lectures >= 6:
+                for teaching in course.teachings:
+                    templates.append(
+                        (
+                            [self.term_x(course.name, teaching.name)]
+                            + [self.term_x(course.name, other.name, -1.0) for other in course.teachings if other != teaching],
+                            -np.inf,
+                            0.0,
+                        )
+                    )
+        yield "11. student_presence", templates, "day"
+        templates = []
+        for teacher, lectures in zip(school.teacher_classes, mod.weekly_lectures(school, school.teacher_classes)):
+            if lectures >= 6:
+                for teaching in teacher.teachings:
+                    templates.append(
+                        (
+                            [self.term_y(teacher.name, teaching.name)]
+                            + [self.term_y(teacher.name, other.name, -1.0) for other in teacher.teachings if other != teaching],
+                            -np.inf,
+                            0.0,
+                        )
+                    )
+        yield "12. professor_presence", templates, "day"
+
+        if self.rooms == "rooms":
+            # 13. free rooms
+            yield (
+                "13. free_room",
+                [
+                    (
+                        [("z", k, 1.0) for k in range(len(self.pairs["z"]))],
+                        -np.inf,
+                        len(self.sets["rooms"]) - parameters[3],
+                    )
+                ],
+                "slot",
+            )
+        elif self.rooms == "matching":
+            # 16. room capacity of every size interval
+            yield (
+                "16. room_capacity",
+                [
+                    (
+                        [
+                            self.term_y(teacher, teaching)
+                            for teaching in inside
+                            for teacher in teachers_by_teaching.get(teaching, [])
+                        ],
+                        -np.inf,
+                        rooms,
+                    )
+                    for inside, rooms in mod.capacity_intervals(school, parameters)
+                ],
+                "slot",
+            )
+
+        # 15. max hours per day for each professor
+        yield (
+            "15. professor_limit",
+            [
+                ([self.term_y(teacher.name, t.name) for t in teacher.teachings], -np.inf, 3.0)
+                for teacher in school.teacher_classes
+            ],
+            "day",
+        )
+
+    # ------------------------------------Names------------------------------------
+    # (variable, day, hour, *pair) of every column, the name map between the matrix and
+    # the x, y, z, w indexes of the Pyomo model
+    def column_index(self, col):
+        for kind, pairs in reversed(list(self.pairs.items())):
+            if col >= self.offset[kind] and pairs:
+                slot, k = divmod(col - self.offset[kind], len(pairs))
+                day, hour = self.days[slot // len(self.hours)], self.hours[slot % len(self.hours)]
+                return (kind, day, hour) + tuple(self.pairs[kind][k])
+        raise IndexError(col)
+
+    # short names usable in MPS/LP files: <variable>_<day>_<hour>_<pair position>
+    def column_names(self):
+        names = []
+        for kind, pairs in self.pairs.items():
+            for day in self.days:
+                for hour in self.hours:
+                    names.extend(f"{kind}_{day}_{hour}_{k}" for k in range(len(pairs)))
+        return names
+
+    def row_names(self):
+        names = []
+        for name, first, count in self.families:
+            label = name.split(". ")[-1]
+            names.extend(f"{label}_{i}" for i in range(count))
+        return names
+
+    # column name -> (variable, day, hour, *pair), e.g. to read back the solution of an
+    # external solver that was given the MPS/LP file
+    def name_map(self):
+        return pd.DataFrame(
+            [(name,) + self.column_index(col) for col, name in enumerate(self.column_names())],
+            columns=["name", "variable", "day", "hour", "first", "second", "third"][
+                : 4 + max(len(pairs[0]) for pairs in self.pairs.values() if pairs)
+            ],
+        ).set_index("name")
+
+    # ------------------------------------Solution------------------------------------
+    # column values of a long solution table (see school_output.extract_solution)
+    def start_values(self, solution):
+        values = np.zeros(self.n_cols)
+        slot_ids = {(day, hour): i * len(self.hours) + j for i, day in enumerate(self.days) for j, hour in enumerate(self.hours)}
+        room_types = {room.name: (room.campus, room.size) for room in self.school.room_classes}
+        for row in solution.itertuples(index=False):
+            slot = slot_ids.get((row.day, row.hour))
+            if slot is None or (row.course, row.teaching) not in self.position["x"]:
+                continue
+            terms = [self.term_x(row.course, row.teaching), self.term_y(row.teacher, row.teaching)]
+            if (row.teaching, row.room) in self.position["z"]:
+                terms.append(("z", self.position["z"][(row.teaching, row.room)], 1.0))
+            room_type = room_types.get(row.room)
+            if room_type is not None and (row.teaching,) + room_type in self.position["w"]:
+                terms.append(("w", self.position["w"][(row.teaching,) + room_type], 1.0))
+            for kind, position, coefficient in terms:
+                values[self.offset[kind] + slot * len(self.pairs[kind]) + position] = 1.0
+        return values
+
+    # long solution table of column values, with the rooms named or matched for the types
+    # and matching modes (see school_rooms.solution_rooms)
+    def to_solution(self, values):
+        frames = {kind: [] for kind in self.pairs}
+        for col in np.flatnonzero(values > 0.5):
+            index = self.column_index(col)
+            frames[index[0]].append(index[1:])
+        x = pd.DataFrame(frames["x"], columns=["day", "hour", "course", "teaching"])
+        y = pd.DataFrame(frames["y"], columns=["day", "hour", "teacher", "teaching"])
+        if self.substituted:
+            teachers = {teaching: teacher for teacher, teaching in self.sets["teacher_teachings"]}
+            substituted = x[x["teaching"].isin(self.substituted)]
+            y = pd.concat(
+                [y, substituted.assign(teacher=substituted["teaching"].map(teachers))[y.columns]], ignore_index=True
+            )
+        z = pd.DataFrame(frames["z"], columns=["day", "hour", "teaching", "room"])
+        solution = out.merge_solution(x, y.drop_duplicates(), z)
+        if self.rooms == "types":
+            types = pd.DataFrame(frames["w"], columns=["day", "hour", "teaching", "campus", "size"])
+            solution = rms.name_rooms(solution, types, self.school)
+        elif self.rooms == "matching":
+            solution = rms.assign_rooms(solution, self.school, self.parameters)
+        return solution
+
+    # ------------------------------------Cache------------------------------------
+    # the built model as a dict of arrays, and back on a model created with build=False
+    def arrays(self):
+        return dict(
+            data=self.matrix.data,
+            indices=self.matrix.indices,
+            indptr=self.matrix.indptr,
+            cost=self.cost,
+            row_lower=self.row_lower,
+            row_upper=self.row_upper,
+            family_names=np.array([name for name, first, count in self.families]),
+            family_rows=np.array([(first, count) for name, first, count in self.families], dtype=np.int64),
+        )
+
+    def load(self, arrays):
+        self.n_rows = len(arrays["row_lower"])
+        self.matrix = sp.csc_matrix(
+            (arrays["data"], arrays["indices"], arrays["indptr"]), shape=(self.n_rows, self.n_cols)
+        )
+        self.cost = arrays["cost"]
+        self.row_lower = arrays["row_lower"]
+        self.row_upper = arrays["row_upper"]
+        self.families = [
+            (str(name), int(first), int(count))
+            for name, (first, count) in zip(arrays["family_names"], arrays["family_rows"])
+        ]
+        self.build_time = 0.0
+
+    # ------------------------------------HiGHS------------------------------------
+    def highs(self, config=None, names=False):
+        import highspy
+
+        config = config if config is not None else sol.SolverConfig("highs")
+        lp = highspy.HighsLp()
+        lp.num_col_ = self.n_cols
+        lp.num_row_ = self.n_rows
+        lp.col_cost_ = self.cost
+        lp.col_lower_ = np.zeros(self.n_cols)
+        lp.col_upper_ = np.ones(self.n_cols)
+        lp.row_lower_ = self.row_lower
+        lp.row_upper_ = self.row_upper
+        lp.a_matrix_.format_ = highspy.MatrixFormat.kColwise
+        lp.a_matrix_.start_ = self.matrix.indptr
+        lp.a_matrix_.index_ = self.matrix.indices
+        lp.a_matrix_.value_ = self.matrix.data
+        lp.integrality_ = [highspy.HighsVarType.kInteger] * self.n_cols
+        if names:
+            lp.col_names_ = self.column_names()
+            lp.row_names_ = self.row_names()
+        highs = highspy.Highs()
+        highs.setOptionValue("output_flag", config.tee)
+        for option, value in dict(
+            time_limit=config.time_limit, mip_rel_gap=config.mip_gap, threads=config.threads, random_seed=config.seed
+        ).items():
+            if value is not None:
+                highs.setOptionValue(option, value)
+        highs.passModel(lp)
+        return highs
+
+    # MPS or LP, by the extension of filename, written by HiGHS
+    def write(self, filename):
+        self.highs(names=True).writeModel(filename)
+        print(f"Matrix model written to {filename}")
+
+    # ------------------------------------Streamed LP------------------------------------
+    # LP file written as the model is generated: the objective slot by slot, then every
+    # family in chunks of rows (see family_rows) and the binary columns, so only the
+    # templates of one family and one chunk of rows are in memory whatever the size of the
+    # school; rows and columns are named as in row_names and column_names. Works with
+    # build=False. MPS lists the matrix column by column and cannot be streamed by rows
+    def write_lp(self, filename, chunk_size=500000):
+        start = time.perf_counter()
+        n_rows = 0
+        with open(filename, "w") as file:
+            file.write("\\ timetable model, see school_matrix.MatrixModel\nminimize\n obj:")
+            for slot in range(self.n_slots):
+                cols, costs = self.slot_cost(self.prof_cost, slot)
+                # a line break after every slot, ten terms per line within it
+                file.write(lp_terms(self.names_of(cols), costs) + "\n")
+            file.write("subject to\n")
+            for name, templates, scope in self.constraint_families():
+                label = name.split(". ")[-1]
+                count = 0
+                for matrix, lower, upper in self.family_rows(templates, scope, chunk_size):
+                    names = self.names_of(matrix.indices)
+                    lines = []
+                    for i in range(matrix.shape[0]):
+                        begin, end = matrix.indptr[i], matrix.indptr[i + 1]
+                        terms = lp_terms(names[begin:end], matrix.data[begin:end])
+                        row = f"{label}_{count + i}"
+                        if lower[i] == upper[i]:
+                            lines.append(f" {row}:{terms} = {upper[i]:.17g}\n")
+                        elif lower[i] == -np.inf:
+                            lines.append(f" {row}:{terms} <= {upper[i]:.17g}\n")
+                        elif upper[i] == np.inf:
+                            lines.append(f" {row}:{terms} >= {lower[i]:.17g}\n")
+                        else:
+                            # the LP format has no ranged rows
+                            lines.append(f" {row}_lower:{terms} >= {lower[i]:.17g}\n")
+                            lines.append(f" {row}_upper:{terms} <= {upper[i]:.17g}\n")
+                    file.writelines(lines)
+                    count += matrix.shape[0]
+                print(f"{name}: {count} rows")
+                n_rows += count
+            file.write("binary\n")
+            for kind, pairs in self.pairs.items():
+                for slot in range(self.n_slots):
+                    cols = self.offset[kind] + slot * len(pairs) + np.arange(len(pairs))
+                    names = self.names_of(cols)
+                    for first in range(0, len(names), 10):
+                        file.write(" " + " ".join(names[first : first + 10]) + "\n")
+            file.write("end\n")
+        print(
+            f"Matrix model streamed to {filename}: {self.n_cols} columns, {n_rows} rows "
+            f"in {time.perf_counter() - start:.1f}s"
+        )
+
+    # column names of an array of column numbers, see column_names
+    def names_of(self, cols):
+        kinds = list(self.pairs)
+        offsets = np.array([self.offset[kind] for kind in kinds], dtype=np.int64)
+        sizes = np.array([max(1, len(self.pairs[kind])) for kind in kinds], dtype=np.int64)
+        which = np.searchsorted(offsets, cols, side="right") - 1
+        slot, k = np.divmod(np.asarray(cols, dtype=np.int64) - offsets[which], sizes[which])
+        prefixes = [[f"{kind}_{day}_{hour}_" for day in self.days for hour in self.hours] for kind in kinds]
+        return [prefixes[w][s] + str(j) for w, s, j in zip(which.tolist(), slot.tolist(), k.tolist())]
+
+    # solve with HiGHS, optionally from the start of a long solution table; returns the
+    # column values (None without a solution, e.g. infeasible or no incumbent in the time
+    # limit) and the SolverResult; raises RuntimeError if HiGHS fails to run
+    def solve(self, config=None, start=None):
+        import highspy
+
+        highs = self.highs(config)
+        if start is not None:
+            solution = highspy.HighsSolution()
+            solution.col_value = self.start_values(start)
+            highs.setSolution(solution)
+        begin = time.perf_counter()
+        status = highs.run()
+        wall_time = time.perf_counter() - begin
+        if status == highspy.HighsStatus.kError:
+            model_status = highs.modelStatusToString(highs.getModelStatus())
+            raise RuntimeError(
+                f"HiGHS failed on the matrix model (model status {model_status}), see its log with tee=True"
+            )
+        info = highs.getInfo()
+        values = None
+        objective = None
+        if highs.getSolution().value_valid:
+            values = np.array(highs.getSolution().col_value)
+            objective = info.objective_function_value
+        bound = info.mip_dual_bound
+        result = sol.SolverResult(
+            solver="highs (matrix)",
+            status=highs.modelStatusToString(highs.getModelStatus()),
+            objective=objective,
+            bound=bound,
+            gap=sol.relative_gap(objective, bound),
+            wall_time=wall_time,
+        )
+        print("Solver result: ", result)
+        return values, result
+
+
+# ------------------------------------Model cache------------------------------------
+# the matrix model loaded from cache_dir when one was built from the same inputs, built and
+# stored otherwise; key is the hash of the inputs of the school (files, filters, mode, seed,
+# see school_cache.input_hash and file_hash), rooms, presolve, prof_cost and the calendar
+# costs (the calendar may come from a file) are added here.
+# Only the sets and the column layout are computed on a hit; max_size (bytes) bounds the
+# cache with least recently used eviction, see school_cache.cached_arrays
+def cached_model(school, parameters, prof_cost, key, rooms="rooms", presolve=False, cache_dir=None, max_size=None):
+    key = cache.input_hash(
+        key,
+        parameters,
+        rooms,
+        presolve,
+        np.asarray(prof_cost).tolist(),
+        school.get_columns()["calendar_cost"].tolist(),
+    )
+    built = []
+
+    def build():
+        built.append(MatrixModel(school, parameters, prof_cost, rooms, presolve))
+        return built[0].arrays()
+
+    arrays = cache.cached_arrays(cache_dir, "model", key, build, max_size)
+    if built:
+        return built[0]
+    model = MatrixModel(school, parameters, prof_cost, rooms, presolve, build=False)
+    model.load(arrays)
+    print(f"Matrix model: {model.n_cols} columns, {model.n_rows} rows, {model.matrix.nnz} nonzeros from the cache")
+    return model
+
+
+# " + 1 x_1_1_0 - 1 y_1_1_3 ..." of a row or of the objective, ten terms per line
+def lp_terms(names, coefficients):
+    terms = [
+        f" {'-' if coefficient < 0 else '+'} {abs(coefficient):.17g} {name}"
+        for name, coefficient in zip(names, coefficients.tolist())
+    ]
+    return "\n ".join("".join(terms[first : first + 10]) for first in range(0, len(terms), 10))
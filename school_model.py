@@ -1,16 +1,40 @@
+import numpy as np
 import pyomo.environ as pyo
 import pyomo.kernel as pmo
-import random
 
 
 # ------------------------------------Sets------------------------------------
-def set_creation(school):
+def set_creation(school, parameters):
     days_ = set([i.day for i in school.calendar_classes])
     hours_ = set([i.hour for i in school.calendar_classes])
     rooms_ = set(i.name for i in school.room_classes)
     teachings_ = set(i.name for i in school.teaching_classes)
     courses_ = set([i.name for i in school.course_classes])
     teachers_ = set(i.name for i in school.teacher_classes)
+    # sparse index sets: only the pairs that can ever be 1
+    course_teachings_ = set(
+        (course.name, teaching.name)
+        for course in school.course_classes
+        for teaching in course.teachings
+    )
+    teacher_teachings_ = set(
+        (teacher.name, teaching.name)
+        for teacher in school.teacher_classes
+        for teaching in teacher.teachings
+    )
+    school.build_room_compatibility(parameters[1])  # max_room_size
+    teaching_rooms_ = set(
+        (teaching.name, room.name)
+        for teaching in school.teaching_classes
+        for room in school.get_rooms_by_teaching(teaching.name)
+    )
+    # room types: the (campus, room_size) of the compatible rooms, see School.build_room_types
+    school.build_room_types()
+    teaching_room_types_ = set(
+        (teaching.name, room.campus, room.size)
+        for teaching in school.teaching_classes
+        for room in school.get_rooms_by_teaching(teaching.name)
+    )
     return dict(
         days=days_,
         hours=hours_,
@@ -18,6 +42,10 @@ def set_creation(school):
         teachings=teachings_,
         courses=courses_,
         teachers=teachers_,
+        course_teachings=course_teachings_,
+        teacher_teachings=teacher_teachings_,
+        teaching_rooms=teaching_rooms_,
+        teaching_room_types=teaching_room_types_,
     )
 
 
@@ -31,6 +59,27 @@ def unpack_sets(sets):
     return days_, hours_, rooms_, teachings_, courses_, teachers_
 
 
+# weekly lectures of each teaching in teachings, gathered from the columns in one go (the
+# right-hand sides of a whole constraint family)
+def teaching_lectures(school, teachings):
+    return school.get_columns()["teaching_frequency"][[teaching.id for teaching in teachings]].tolist()
+
+
+# weekly lectures of each course or teacher of owners (school.course_classes or
+# school.teacher_classes), summed over their teachings in one pass
+def weekly_lectures(school, owners):
+    index = [i for i, owner in enumerate(owners) for teaching in owner.teachings]
+    lectures = teaching_lectures(school, [teaching for owner in owners for teaching in owner.teachings])
+    return np.bincount(np.array(index, dtype=np.int64), weights=lectures, minlength=len(owners)).tolist()
+
+
+def unpack_index_sets(sets):
+    course_teachings_ = sets["course_teachings"]
+    teacher_teachings_ = sets["teacher_teachings"]
+    teaching_rooms_ = sets["teaching_rooms"]
+    return course_teachings_, teacher_teachings_, teaching_rooms_
+
+
 # ------------------------------------Model------------------------------------
 def model_creation():
     model = pyo.ConcreteModel(name="Classroom Timetable")
@@ -39,45 +88,91 @@ def model_creation():
 
 
 # ------------------------------------Variables------------------------------------
-def model_variables(model, sets):
+# y is a variable, or with a presolve (see substitute_y) an expression giving x for the
+# substituted teachings and y_free for the others
+def teacher_variables(model, sets, substituted=None):
+    days_, hours_, rooms_, teachings_, courses_, teachers_ = unpack_sets(sets)
+    course_teachings_, teacher_teachings_, teaching_rooms_ = unpack_index_sets(sets)
+    if substituted is None:
+        return pyo.Var(days_, hours_, teacher_teachings_, domain=pmo.Binary)
+    free = sorted((teacher, teaching) for teacher, teaching in teacher_teachings_ if teaching not in substituted)
+    if free:
+        model.y_free = pyo.Var(days_, hours_, free, domain=pmo.Binary)
+
+    def rule(model, day, hour, teacher, teaching):
+        if teaching in substituted:
+            return model.x[day, hour, substituted[teaching], teaching]
+        return model.y_free[day, hour, teacher, teaching]
+
+    return pyo.Expression(days_, hours_, teacher_teachings_, rule=rule)
+
+
+# x and y only, for the two-stage mode: rooms are assigned after the solve (see school_rooms)
+def time_variables(model, sets, substituted=None):
     days_, hours_, rooms_, teachings_, courses_, teachers_ = unpack_sets(sets)
-    model.x = pyo.Var(days_, hours_, courses_, teachings_, domain=pmo.Binary)
-    model.y = pyo.Var(days_, hours_, teachers_, teachings_, domain=pmo.Binary)
-    model.z = pyo.Var(days_, hours_, teachings_, rooms_, domain=pmo.Binary)
+    course_teachings_, teacher_teachings_, teaching_rooms_ = unpack_index_sets(sets)
+    model.x = pyo.Var(days_, hours_, course_teachings_, domain=pmo.Binary)
+    model.y = teacher_variables(model, sets, substituted)
+    print(f"Variables defined: ", model.x, model.y)
+    return model.x, model.y
+
+
+def model_variables(model, sets, substituted=None):
+    days_, hours_, rooms_, teachings_, courses_, teachers_ = unpack_sets(sets)
+    course_teachings_, teacher_teachings_, teaching_rooms_ = unpack_index_sets(sets)
+    model.x = pyo.Var(days_, hours_, course_teachings_, domain=pmo.Binary)
+    model.y = teacher_variables(model, sets, substituted)
+    model.z = pyo.Var(days_, hours_, teaching_rooms_, domain=pmo.Binary)
     print(f"Variables defined: ", model.x, model.y, model.z)
     return model.x, model.y, model.z
 
 
+# w replaces z when interchangeable rooms are grouped: w[d, h, teaching, campus, room_size]
+# is 1 if the lecture is in one of the rooms of that type, see school_rooms.name_rooms
+def room_type_variables(model, sets, substituted=None):
+    days_, hours_, rooms_, teachings_, courses_, teachers_ = unpack_sets(sets)
+    course_teachings_, teacher_teachings_, teaching_rooms_ = unpack_index_sets(sets)
+    model.x = pyo.Var(days_, hours_, course_teachings_, domain=pmo.Binary)
+    model.y = teacher_variables(model, sets, substituted)
+    model.w = pyo.Var(days_, hours_, sets["teaching_room_types"], domain=pmo.Binary)
+    print(f"Variables defined: ", model.x, model.y, model.w)
+    return model.x, model.y, model.w
+
+
 # ------------------------------------Parameters------------------------------------
-def prof_cost(model, sets, school, profiles):
+def prof_cost(model, sets, school, profiles, seed=0, cache_dir=None):
     days_, hours_, rooms_, teachings_, courses_, teachers_ = unpack_sets(sets)
-    model.prof_cost = pyo.Param(days_, hours_, teachers_, initialize=1, mutable=True)
-    for day in days_:
-        for hour in hours_:
-            for teacher in school.teacher_classes:
-                if (
-                    day in profiles[teacher.profile]["days"]
-                    and hour in profiles[teacher.profile]["hours"]
-                ):
-                    model.prof_cost[day, hour, teacher.name] = (
-                        50 + random.randint(-5, 5)
-                    ) * teacher.seniority
-                else:
-                    model.prof_cost[day, hour, teacher.name] = 1
+    columns = school.get_columns()
+    cost = school.build_prof_cost(profiles, seed, cache_dir)
+    model.prof_cost = pyo.Param(
+        days_,
+        hours_,
+        teachers_,
+        initialize={
+            (int(day), int(hour), teacher.name): float(cost[i, j, teacher.id])
+            for i, day in enumerate(columns["calendar_days"])
+            for j, hour in enumerate(columns["calendar_hours"])
+            for teacher in school.teacher_classes
+        },
+        mutable=True,
+    )
     return model.prof_cost
 
 
+# the calendar cost does not depend on the teaching: one value per (day, hour)
 def cal_cost(model, sets, school):
     days_, hours_, rooms_, teachings_, courses_, teachers_ = unpack_sets(sets)
-    model.cal_cost = pyo.Param(days_, hours_, teachings_, initialize=0, mutable=True)
-    for day in days_:
-        for hour in hours_:
-            for teaching in teachings_:
-                model.cal_cost[day, hour, teaching] = [
-                    c.cost
-                    for c in school.calendar_classes
-                    if c.day == day and c.hour == hour
-                ][0]
+    columns = school.get_columns()
+    model.cal_cost = pyo.Param(
+        days_,
+        hours_,
+        initialize={
+            (int(day), int(hour)): float(columns["calendar_cost"][i, j])
+            for i, day in enumerate(columns["calendar_days"])
+            for j, hour in enumerate(columns["calendar_hours"])
+        },
+        mutable=True,
+    )
     return model.cal_cost
 
 
@@ -97,8 +192,8 @@ def cal_cost(model, sets, school):
 #     return model.overlap_cost
 
 
-def model_parameters(model, sets, school, profiles):
-    model.prof_cost = prof_cost(model, sets, school, profiles)
+def model_parameters(model, sets, school, profiles, seed=0, cache_dir=None):
+    model.prof_cost = prof_cost(model, sets, school, profiles, seed, cache_dir)
     model.cal_cost = cal_cost(model, sets, school)
     # model.overlap_cost = overlap_cost(model, sets, school)
     print("Parameters defined: prof_cost, cal_cost")
@@ -120,7 +215,7 @@ def model_objective(model, sets, school):
             for teach in teacher.teachings
         )
         + sum(
-            model.cal_cost[day, hour, teaching.name]
+            model.cal_cost[day, hour]
             * model.x[day, hour, course.name, teaching.name]
             for day in days_
             for hour in hours_
@@ -149,35 +244,44 @@ def model_objective(model, sets, school):
 # 1. All lectures must be assigned, both for mandatory courses and elective
 def all_courses(model, sets, school):
     days_, hours_, rooms_, teachings_, courses_, teachers_ = unpack_sets(sets)
+    pairs = [(course, teaching) for course in school.course_classes for teaching in course.teachings]
+    frequency = teaching_lectures(school, [teaching for course, teaching in pairs])
     model.all_courses = pyo.ConstraintList()
-    for course in school.course_classes:
-        for teaching in course.teachings:
-            model.all_courses.add(
-                sum(
-                    model.x[d, h, course.name, teaching.name]
-                    for d in days_
-                    for h in hours_
-                )
-                == teaching.frequency
+    for (course, teaching), lectures in zip(pairs, frequency):
+        model.all_courses.add(
+            sum(
+                model.x[d, h, course.name, teaching.name]
+                for d in days_
+                for h in hours_
             )
+            == lectures
+        )
     print("1. All Course lectures must be assigned")
     return model.all_courses
 
 
 # 2. The sum of the lectures in a particular teaching of a professor, must be equal to the total hours to be assigned
-def all_teachers(model, sets, school):
+# (substituted teachings repeat their row of 1, see substitute_y)
+def all_teachers(model, sets, school, substituted=None):
     days_, hours_, rooms_, teachings_, courses_, teachers_ = unpack_sets(sets)
+    substituted = substituted if substituted is not None else {}
+    pairs = [
+        (teacher, teaching)
+        for teacher in school.teacher_classes
+        for teaching in teacher.teachings
+        if teaching.name not in substituted
+    ]
+    frequency = teaching_lectures(school, [teaching for teacher, teaching in pairs])
     model.all_teachers = pyo.ConstraintList()
-    for teacher in school.teacher_classes:
-        for teaching in teacher.teachings:
-            model.all_teachers.add(
-                sum(
-                    model.y[d, h, teacher.name, teaching.name]
-                    for d in days_
-                    for h in hours_
-                )
-                == teaching.frequency
+    for (teacher, teaching), lectures in zip(pairs, frequency):
+        model.all_teachers.add(
+            sum(
+                model.y[d, h, teacher.name, teaching.name]
+                for d in days_
+                for h in hours_
             )
+            == lectures
+        )
     print("2. All Teacher lectures must be assigned")
     return model.all_teachers
 
@@ -185,18 +289,19 @@ def all_teachers(model, sets, school):
 # 3. During the whole week, the number of times rooms are occupied by a teaching must be equal to the total number of lectures that must be assigned for that teaching
 def all_rooms(model, sets, school):
     days_, hours_, rooms_, teachings_, courses_, teachers_ = unpack_sets(sets)
+    teachings = [teaching for course in school.course_classes for teaching in course.teachings]
+    frequency = teaching_lectures(school, teachings)
     model.all_rooms = pyo.ConstraintList()
-    for course in school.course_classes:
-        for teaching in course.teachings:
-            model.all_rooms.add(
-                sum(
-                    model.z[d, h, teaching.name, room.name]
-                    for d in days_
-                    for h in hours_
-                    for room in school.room_classes
-                )
-                == teaching.frequency
+    for teaching, lectures in zip(teachings, frequency):
+        model.all_rooms.add(
+            sum(
+                model.z[d, h, teaching.name, room.name]
+                for d in days_
+                for h in hours_
+                for room in school.get_rooms_by_teaching(teaching.name)
             )
+            == lectures
+        )
     print("3. All Room lecture must be assigned")
     return model.all_rooms
 
@@ -205,86 +310,71 @@ def all_rooms(model, sets, school):
 def room_size(model, sets, school, parameters):
     days_, hours_, rooms_, teachings_, courses_, teachers_ = unpack_sets(sets)
     model.room_size = pyo.ConstraintList()
+    # incompatible (teaching, room) pairs are never created, see School.build_room_compatibility
     for d in days_:
         for h in hours_:
-            for room in school.room_classes:
-                for course in school.course_classes:
-                    for teaching in course.teachings:
-                        if teaching.size > room.size:
-                            model.room_size.add(
-                                model.z[d, h, teaching.name, room.name] == 0
-                            )
-                        elif room.size > teaching.size + parameters[1]:  # max_room_size
-                            model.room_size.add(
-                                model.z[d, h, teaching.name, room.name] == 0
-                            )
-                        else:
-                            model.room_size.add(
-                                model.z[d, h, teaching.name, room.name]
-                                <= model.x[d, h, course.name, teaching.name]
-                            )
+            for course in school.course_classes:
+                for teaching in course.teachings:
+                    for room in school.get_rooms_by_teaching(teaching.name):
+                        model.room_size.add(
+                            model.z[d, h, teaching.name, room.name]
+                            <= model.x[d, h, course.name, teaching.name]
+                        )
     print("4. Room size must fit the teaching size")
     return model.room_size
 
 
 # --------------------------------Ubiquity Costraint--------------------------------
 
-# 5. Students can follow only one teaching in a time slot except for different partition
+# 5. Students can follow only one teaching in a time slot except for different partition.
+# Courses are read per (course, partition), so every teaching of a course has its partition:
+# each course has one mandatory row and one elective row per slot, keyed by (day, hour,
+# course, partition, group) and added once instead of once per teaching of the group
 def ubiquity_stud(model, sets, school, parameters):
     days_, hours_, rooms_, teachings_, courses_, teachers_ = unpack_sets(sets)
+    # mask of the whole family as a list: indexed per teaching below
+    mandatory = school.get_columns()["teaching_mandatory"].tolist()
+    mandatory_teachings = {
+        course.id: [t.name for t in course.teachings if mandatory[t.id]]
+        for course in school.course_classes
+    }
+    elective_teachings = {
+        course.id: [t.name for t in course.teachings if not mandatory[t.id]]
+        for course in school.course_classes
+    }
     model.ubiquity_stud = pyo.ConstraintList()
+    rows = set()
+    duplicates = 0
     for day in days_:
         for hour in hours_:
             for course in school.course_classes:
-                if course.partition == "NO":
-                    for teaching in course.teachings:
-                        if teaching.elective == "Obbligatorio":
-                            model.ubiquity_stud.add(
-                                sum(
-                                    model.x[day, hour, course.name, teaching.name]
-                                    for teaching in course.teachings
-                                    if teaching.elective == "Obbligatorio"
-                                )
-                                <= 1
-                            )
-                        else:
-                            model.ubiquity_stud.add(
-                                sum(
-                                    model.x[day, hour, course.name, teaching.name]
-                                    for teaching in course.teachings
-                                    if teaching.elective != "Obbligatorio"
-                                )
-                                <= parameters[4]
-                            )
-                else:
-                    for partition in course.partition:
-                        for teaching in course.teachings:
-                            if teaching.partition == partition:
-                                if teaching.elective == "Obbligatorio":
-                                    model.ubiquity_stud.add(
-                                        sum(
-                                            model.x[day, hour, course.name, teaching.name]
-                                            for teaching in course.teachings
-                                            if teaching.elective == "Obbligatorio"
-                                        )
-                                        <= 1
-                                    )
-                                else:
-                                    model.ubiquity_stud.add(
-                                        sum(
-                                            model.x[day, hour, course.name, teaching.name]
-                                            for teaching in course.teachings
-                                            if teaching.elective != "Obbligatorio"
-                                        )
-                                        <= parameters[4]
-                                        * (1 - sum(
-                                                model.x[day, hour, course.name, teaching.name]
-                                                for teaching in course.teachings
-                                                if teaching.elective == "Obbligatorio"
-                                            )
-                                        )
-                                    )
-    print("5. Students can follow only one teaching in a time slot except for different partition")
+                for teaching in course.teachings:
+                    group = "mandatory" if mandatory[teaching.id] else "elective"
+                    key = (day, hour, course.id, course.partition, group)
+                    if key in rows:
+                        duplicates += 1
+                        continue
+                    rows.add(key)
+                    if mandatory[teaching.id]:
+                        model.ubiquity_stud.add(
+                            sum(model.x[day, hour, course.name, t] for t in mandatory_teachings[course.id])
+                            <= 1
+                        )
+                    elif course.partition == "NO":
+                        model.ubiquity_stud.add(
+                            sum(model.x[day, hour, course.name, t] for t in elective_teachings[course.id])
+                            <= parameters[4]
+                        )
+                    else:
+                        model.ubiquity_stud.add(
+                            sum(model.x[day, hour, course.name, t] for t in elective_teachings[course.id])
+                            <= parameters[4]
+                            * (1 - sum(model.x[day, hour, course.name, t] for t in mandatory_teachings[course.id]))
+                        )
+    print(
+        "5. Students can follow only one teaching in a time slot except for different partition "
+        f"({len(rows)} rows, {duplicates} duplicates avoided)"
+    )
     return model.ubiquity_stud
 
 
@@ -312,10 +402,14 @@ def ubiquity_rooms(model, sets, school):
     for d in days_:
         for h in hours_:
             for room in school.room_classes:
-                model.ubiquity_rooms.add(
-                    sum(model.z[d, h, teaching.name, room.name] for teaching in school.teaching_classes)
-                    <= 1
-                )
+                if school.get_teachings_by_room(room.name):
+                    model.ubiquity_rooms.add(
+                        sum(
+                            model.z[d, h, teaching.name, room.name]
+                            for teaching in school.get_teachings_by_room(room.name)
+                        )
+                        <= 1
+                    )
     print("7. There cannot be more than one lecture in a room in a given moment")
     return model.ubiquity_rooms
 
@@ -330,25 +424,32 @@ def link_z_x(model, sets, school):
             for course in school.course_classes:
                 for teaching in course.teachings:
                     model.link_z_x.add(
-                        sum(model.z[d, h, teaching.name, room.name] for room in school.room_classes)
+                        sum(model.z[d, h, teaching.name, room.name] for room in school.get_rooms_by_teaching(teaching.name))
                         == model.x[d, h, course.name, teaching.name]
                     )
     print("8. Linking z and x: in a given moment, if course has a lecture, then it is in the same room of the same teaching")
     return model.link_z_x
 
 # 9. Linking the binary variable y with x, in a given moment, if there's a lecture of a teaching, then one of the professors that teach that teaching will have lecture
-def link_y_x(model, sets, school):
+# (y of a substituted teaching is x of its first course, whose row is always true, see substitute_y)
+def link_y_x(model, sets, school, substituted=None):
     days_, hours_, rooms_, teachings_, courses_, teachers_ = unpack_sets(sets)
+    course_teachings_, teacher_teachings_, teaching_rooms_ = unpack_index_sets(sets)
+    teachers_by_teaching = {teaching: [] for teaching in teachings_}
+    for teacher, teaching in teacher_teachings_:
+        teachers_by_teaching.setdefault(teaching, []).append(teacher)
+    substituted = substituted if substituted is not None else {}
     model.link_y_x = pyo.ConstraintList()
     for d in days_:
         for h in hours_:
             for course in school.course_classes:
                 for teaching in course.teachings:
+                    if substituted.get(teaching.name) == course.name:
+                        continue
                     model.link_y_x.add(
                         sum(
-                            model.y[d, h, teacher.name, teaching.name]
-                            for teacher in school.teacher_classes
-                            if teaching in teacher.teachings
+                            model.y[d, h, teacher, teaching.name]
+                            for teacher in teachers_by_teaching[teaching.name]
                         )
                         == model.x[d, h, course.name, teaching.name]
                     )
@@ -374,10 +475,11 @@ def repeat_teaching(model, sets, school):
 # 11. If there's one lecture in the day, there must be at least another one of the same course
 def student_presence(model, sets, school):
     days_, hours_, rooms_, teachings_, courses_, teachers_ = unpack_sets(sets)
+    weekly = weekly_lectures(school, school.course_classes)
     model.student_presence = pyo.ConstraintList()
     for day in days_:
-        for course in school.course_classes:
-            if sum([teaching.frequency for teaching in course.teachings]) >= 6:
+        for course, lectures in zip(school.course_classes, weekly):
+            if lectures >= 6:
                 for teaching in course.teachings:
                     model.student_presence.add(
                         sum(
@@ -399,10 +501,11 @@ def student_presence(model, sets, school):
 # 12. If there's one lecture in the day, there must be at least another one of the same professor
 def professor_presence(model, sets, school):
     days_, hours_, rooms_, teachings_, courses_, teachers_ = unpack_sets(sets)
+    weekly = weekly_lectures(school, school.teacher_classes)
     model.professor_presence = pyo.ConstraintList()
     for day in days_:
-        for teacher in school.teacher_classes:
-            if sum([teaching.frequency for teaching in teacher.teachings]) >= 6:
+        for teacher, lectures in zip(school.teacher_classes, weekly):
+            if lectures >= 6:
                 for teaching in teacher.teachings:
                     model.professor_presence.add(
                         sum(
@@ -426,20 +529,129 @@ def professor_presence(model, sets, school):
 # 13. There must be at least the number of free room set in parameter for each hour
 def free_room(model, sets, school, parameters):
     days_, hours_, rooms_, teachings_, courses_, teachers_ = unpack_sets(sets)
+    course_teachings_, teacher_teachings_, teaching_rooms_ = unpack_index_sets(sets)
     model.free_room = pyo.ConstraintList()
     for day in days_:
         for hour in hours_:
             model.free_room.add(
                 sum(
-                    model.z[day, hour, teaching.name, room.name]
-                    for teaching in school.teaching_classes
-                    for room in school.room_classes
+                    model.z[day, hour, teaching, room]
+                    for teaching, room in teaching_rooms_
                 )
                 <= len(rooms_) - parameters[3]
             )
     print("13. There must be at least the number of free room set in parameter for each hour")
     return model.free_room
 
+
+# [(teachings, rooms)] of every size interval [low, high] holding some teaching: the
+# teachings whose compatible rooms all lie in it and its number of rooms; the whole
+# interval also keeps the free rooms set in parameter
+def capacity_intervals(school, parameters):
+    max_room_size = parameters[1]
+    rooms_by_size = {}
+    for room in school.room_classes:
+        rooms_by_size[room.size] = rooms_by_size.get(room.size, 0) + 1
+    teachings_by_bounds = {}
+    for teaching in school.teaching_classes:
+        bounds = (teaching.size, teaching.size + max_room_size)
+        teachings_by_bounds.setdefault(bounds, []).append(teaching.name)
+
+    low_sizes = sorted(set(low for low, high in teachings_by_bounds))
+    high_sizes = sorted(set(high for low, high in teachings_by_bounds))
+    intervals = []
+    for low in low_sizes:
+        for high in high_sizes:
+            inside = [
+                teaching
+                for (teaching_low, teaching_high), names in teachings_by_bounds.items()
+                if low <= teaching_low and teaching_high <= high
+                for teaching in names
+            ]
+            if inside:
+                rooms = sum(count for size, count in rooms_by_size.items() if low <= size <= high)
+                if low == low_sizes[0] and high == high_sizes[-1]:
+                    rooms = min(rooms, len(school.room_classes) - parameters[3])
+                intervals.append((inside, rooms))
+    return intervals
+
+
+# 16. Two-stage mode, replaces 3, 4, 7, 8 and 13: in each hour the lectures must fit the rooms.
+# Compatible rooms form a size interval for every teaching, so by Hall's theorem a room
+# assignment exists iff for every size interval [low, high] the lectures whose rooms all
+# lie in it are no more than its rooms (see capacity_intervals)
+def room_capacity(model, sets, school, parameters):
+    days_, hours_, rooms_, teachings_, courses_, teachers_ = unpack_sets(sets)
+    course_teachings_, teacher_teachings_, teaching_rooms_ = unpack_index_sets(sets)
+    teachers_by_teaching = {}
+    for teacher, teaching in teacher_teachings_:
+        teachers_by_teaching.setdefault(teaching, []).append(teacher)
+    intervals = capacity_intervals(school, parameters)
+
+    model.room_capacity = pyo.ConstraintList()
+    for d in days_:
+        for h in hours_:
+            for inside, rooms in intervals:
+                model.room_capacity.add(
+                    sum(
+                        model.y[d, h, teacher, teaching]
+                        for teaching in inside
+                        for teacher in teachers_by_teaching.get(teaching, [])
+                    )
+                    <= rooms
+                )
+    print(f"16. The lectures of each hour must fit the rooms ({len(intervals)} size intervals)")
+    return model.room_capacity
+
+
+# 17. Room types mode, replaces 7 and 13: in a given moment a room type cannot hold more
+# lectures than its rooms, and at least the free rooms set in parameter stay free
+def ubiquity_room_types(model, sets, school, parameters):
+    days_, hours_, rooms_, teachings_, courses_, teachers_ = unpack_sets(sets)
+    teachings_by_type = {}
+    for teaching, campus, size in sets["teaching_room_types"]:
+        teachings_by_type.setdefault((campus, size), []).append(teaching)
+    model.ubiquity_room_types = pyo.ConstraintList()
+    for d in days_:
+        for h in hours_:
+            for (campus, size), teachings in teachings_by_type.items():
+                model.ubiquity_room_types.add(
+                    sum(model.w[d, h, teaching, campus, size] for teaching in teachings)
+                    <= len(school.room_types[(campus, size)])
+                )
+            model.ubiquity_room_types.add(
+                sum(
+                    model.w[d, h, teaching, campus, size]
+                    for teaching, campus, size in sets["teaching_room_types"]
+                )
+                <= len(rooms_) - parameters[3]
+            )
+    print("17. A room type cannot hold more lectures than its rooms in a given moment")
+    return model.ubiquity_room_types
+
+
+# 18. Room types mode, replaces 3, 4 and 8: in a given moment, if a teaching of a course
+# has a lecture, then it is in one room type
+def link_w_x(model, sets, school):
+    days_, hours_, rooms_, teachings_, courses_, teachers_ = unpack_sets(sets)
+    types_by_teaching = {}
+    for teaching, campus, size in sets["teaching_room_types"]:
+        types_by_teaching.setdefault(teaching, []).append((campus, size))
+    model.link_w_x = pyo.ConstraintList()
+    for d in days_:
+        for h in hours_:
+            for course in school.course_classes:
+                for teaching in course.teachings:
+                    model.link_w_x.add(
+                        sum(
+                            model.w[d, h, teaching.name, campus, size]
+                            for campus, size in types_by_teaching.get(teaching.name, [])
+                        )
+                        == model.x[d, h, course.name, teaching.name]
+                    )
+    print("18. Linking w and x: in a given moment, if course has a lecture, then it is in one room type")
+    return model.link_w_x
+
 # # 14. Max hours per day for each course
 # model.max_hours_per_day=pyo.ConstraintList()
 # for day in days_:
@@ -527,3 +739,85 @@ def professor_limit(model, sets, school):
             )
     print("15. Max hours per day for each professor")
     return model.professor_limit
+
+
+# ------------------------------------Presolve------------------------------------
+# a teaching with a single teacher has, by 9, y equal to x of each of its courses: y is
+# replaced by x of its first course, which makes its rows of 2 copies of 1 and its row of
+# 9 for that course always true. With z, 3 follows from 1 and 8, and 4 from 8 (z is
+# binary), so those families are dropped too. {teaching: course whose x replaces y}
+def substitute_y(sets):
+    course_teachings_, teacher_teachings_, teaching_rooms_ = unpack_index_sets(sets)
+    teachers_by_teaching = {}
+    for teacher, teaching in teacher_teachings_:
+        teachers_by_teaching.setdefault(teaching, []).append(teacher)
+    courses_by_teaching = {}
+    for course, teaching in course_teachings_:
+        courses_by_teaching.setdefault(teaching, []).append(course)
+    substituted = {
+        teaching: min(courses)
+        for teaching, courses in courses_by_teaching.items()
+        if len(teachers_by_teaching.get(teaching, [])) == 1
+    }
+    print(f"Presolve: y replaced by x for {len(substituted)} of {len(sets['teachings'])} teachings")
+    return substituted
+
+
+# ------------------------------------Model building------------------------------------
+# sets, variables, parameters, objective and constraints in one go; rooms is "rooms" (one
+# z per room), "types" (one w per room type, see room_type_variables) or "matching" (no
+# room variables, rooms are assigned after the solve, see room_capacity); presolve drops
+# the variables and rows implied by the others, see substitute_y
+def build_model(school, parameters, profiles, rooms="rooms", seed=0, cache_dir=None, presolve=False):
+    sets = set_creation(school, parameters)
+    model = model_creation()
+    substituted = substitute_y(sets) if presolve else None
+
+    # Variables
+    if rooms == "matching":
+        model.x, model.y = time_variables(model, sets, substituted)
+    elif rooms == "types":
+        model.x, model.y, model.w = room_type_variables(model, sets, substituted)
+    else:
+        model.x, model.y, model.z = model_variables(model, sets, substituted)
+
+    # Parameters and objective function
+    model.prof_cost, model.cal_cost = model_parameters(model, sets, school, profiles, seed, cache_dir)
+    model.obj = model_objective(model, sets, school)
+
+    # Assignment Costraint
+    model.all_courses = all_courses(model, sets, school)
+    model.all_teachers = all_teachers(model, sets, school, substituted)
+    if rooms == "rooms" and not presolve:
+        model.all_rooms = all_rooms(model, sets, school)
+        model.room_size = room_size(model, sets, school, parameters)
+
+    # Ubiquity Costraint
+    model.ubiquity_stud = ubiquity_stud(model, sets, school, parameters)
+    model.ubiquity_professor = ubiquity_professor(model, sets, school)
+    if rooms == "rooms":
+        model.ubiquity_rooms = ubiquity_rooms(model, sets, school)
+    elif rooms == "types":
+        model.ubiquity_room_types = ubiquity_room_types(model, sets, school, parameters)
+
+    # Liniking Variables
+    if rooms == "rooms":
+        model.link_z_x = link_z_x(model, sets, school)
+    elif rooms == "types":
+        model.link_w_x = link_w_x(model, sets, school)
+    model.link_y_x = link_y_x(model, sets, school, substituted)
+
+    # Daily Costraint
+    model.repeat_teaching = repeat_teaching(model, sets, school)
+    model.student_presence = student_presence(model, sets, school)
+    model.professor_presence = professor_presence(model, sets, school)
+
+    # Optional Constraints
+    if rooms == "matching":
+        # rooms are assigned after the solve, the model only keeps their capacity
+        model.room_capacity = room_capacity(model, sets, school, parameters)
+    elif rooms == "rooms":
+        model.free_room = free_room(model, sets, school, parameters)
+    # model.max_hours_per_day = max_hours_per_day(model, sets, school, parameters)
+    model.professor_limit = professor_limit(model, sets, school)
+    return model, sets
@@ -0,0 +1,76 @@
+import os
+
+import pandas as pd
+import pyomo.environ as pyo
+
+
+SOLUTION_COLUMNS = ["day", "hour", "course", "teaching", "teacher", "room"]
+
+
+# ------------------------------------Extraction------------------------------------
+# nonzero entries of a binary variable as a frame, one column per index position; var can
+# also be an expression standing for a substituted variable (see school_model.substitute_y)
+def nonzero_values(var, columns):
+    if var.ctype is pyo.Var:
+        values = var.extract_values()
+    else:
+        values = {index: pyo.value(expression, exception=False) for index, expression in var.items()}
+    return pd.DataFrame(
+        [index for index, value in values.items() if value is not None and value > 0.5],
+        columns=columns,
+    )
+
+
+# long-format solution: one row per lecture with its (day, hour, course, teaching, teacher, room)
+def extract_solution(model):
+    x = nonzero_values(model.x, ["day", "hour", "course", "teaching"])
+    y = nonzero_values(model.y, ["day", "hour", "teacher", "teaching"])
+    if model.component("z") is not None:
+        z = nonzero_values(model.z, ["day", "hour", "teaching", "room"])
+    else:
+        # two-stage and room types modes: rooms are named afterwards, see school_rooms
+        z = pd.DataFrame(columns=["day", "hour", "teaching", "room"])
+    return merge_solution(x, y, z)
+
+
+# one row per lecture from the nonzero x, y and z frames
+def merge_solution(x, y, z):
+    solution = x.merge(y, on=["day", "hour", "teaching"], how="left").merge(
+        z, on=["day", "hour", "teaching"], how="left"
+    )
+    return solution[SOLUTION_COLUMNS].sort_values(["day", "hour", "course", "teaching"], ignore_index=True)
+
+
+# ------------------------------------Schedules------------------------------------
+# (day, hour) x column grid of the teachings in each cell, "-" where there is none
+def schedule(solution, school, column, names):
+    slots = pd.MultiIndex.from_tuples(
+        sorted(set((c.day, c.hour) for c in school.calendar_classes))
+    )
+    cells = (
+        solution.dropna(subset=[column])
+        .groupby(["day", "hour", column], sort=False)["teaching"]
+        .agg(", ".join)
+        .unstack(column)
+    )
+    return cells.reindex(index=slots, columns=list(dict.fromkeys(names))).fillna("-")
+
+
+def schedule_rooms(solution, school):
+    return schedule(solution, school, "room", [r.name for r in school.room_classes])
+
+
+def schedule_teachers(solution, school):
+    return schedule(solution, school, "teacher", [t.name for t in school.teacher_classes])
+
+
+def schedule_courses(solution, school):
+    return schedule(solution, school, "course", [c.name for c in school.course_classes])
+
+
+def write_schedules(solution, school, output_dir):
+    os.makedirs(output_dir, exist_ok=True)
+    schedule_rooms(solution, school).to_csv(os.path.join(output_dir, "schedule_rooms.csv"))
+    schedule_teachers(solution, school).to_csv(os.path.join(output_dir, "schedule_teachers.csv"))
+    schedule_courses(solution, school).to_csv(os.path.join(output_dir, "schedule_courses.csv"))
+    print(f"Schedules written to {output_dir}: rooms, teachers, courses")
@@ -0,0 +1,182 @@
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+import school_classes as cl
+import school_model as mod
+import school_output as out
+import school_rooms as rms
+import school_solver as sol
+import school_warmstart as wst
+
+# calendar periods are numbered from 1 in this order, whatever periods are solved
+PERIODS = ["1° Periodo", "2° Periodo", "3° Periodo", "4° Periodo"]
+
+
+# number of a period name in the calendar (1 for "1° Periodo")
+def period_number(name):
+    if name not in PERIODS:
+        raise ValueError(f"Unknown period {name!r}, choose one of: {', '.join(PERIODS)}")
+    return PERIODS.index(name) + 1
+
+
+# ------------------------------------One period------------------------------------
+# build, solve and write the schedules of one period; data and rooms are the frames read
+# once by solve_periods, number is the calendar period of name (see period_number)
+def solve_period(
+    name,
+    number,
+    data,
+    rooms_data,
+    qualifications,
+    profiles,
+    calendar,
+    campus=None,
+    mode="relaxed",
+    rooms="rooms",
+    presolve=False,
+    config=None,
+    output_dir="data/Output",
+    warm_start=False,
+    seed=0,
+    cache_dir=None,
+):
+    start = time.perf_counter()
+    school = cl.School.create_school_from_data(
+        data, qualifications, profiles, rooms_data, calendar, period=[name], campus=campus, seed=seed
+    )
+    parameters = cl.define_parameters(name, mode)
+    school.filter_by("calendar_classes", "period", [number])
+    period_dir = os.path.join(output_dir, f"period_{number}")
+    summary = dict(
+        period=name, teachings=len(school.teaching_classes), status=None, objective=None, bound=None, gap=None
+    )
+    if not school.teaching_classes:
+        summary.update(status="empty", wall_time=time.perf_counter() - start)
+        return summary
+
+    model, sets = mod.build_model(school, parameters, profiles, rooms, seed, cache_dir, presolve)
+    # warm start from the schedules of a previous run, see school_warmstart
+    warm_start = warm_start and os.path.isdir(period_dir)
+    if warm_start:
+        prof_cost = school.build_prof_cost(profiles, seed, cache_dir)
+        wst.load_warm_start(model, school, parameters, period_dir, prof_cost)
+    config = config if config is not None else sol.SolverConfig()
+    config.warmstart = warm_start
+    result = sol.solve(model, config)
+    if result.has_solution():
+        solution = out.extract_solution(model)
+        solution = rms.solution_rooms(model, solution, school, parameters)
+        out.write_schedules(solution, school, period_dir)
+    summary.update(
+        status=result.status,
+        objective=result.objective,
+        bound=result.bound,
+        gap=result.gap,
+        wall_time=time.perf_counter() - start,
+    )
+    return summary
+
+
+# ------------------------------------All periods------------------------------------
+# read the csv files once and solve every period in its own process (the frames are
+# pickled to each process with the other arguments, the csv files are not read again), the
+# solver threads split between them; per-period schedules go to
+# output_dir/period_<n> and the objective, gap and time of each period to
+# output_dir/summary.csv
+def solve_periods(
+    periods,
+    courses_file,
+    rooms_file,
+    qualifications,
+    profiles,
+    calendar,
+    campus=None,
+    mode="relaxed",
+    rooms="rooms",
+    presolve=False,
+    config=None,
+    output_dir="data/Output",
+    warm_start=False,
+    workers=None,
+    seed=0,
+    cache_dir=None,
+):
+    start = time.perf_counter()
+    numbers = [period_number(name) for name in periods]
+    data = cl.TeachingClass.read_data(courses_file)
+    data = cl.BaseClass.filter_data(data, "Period", periods)
+    rooms_data = cl.RoomClass.read_data(rooms_file)
+    config = config if config is not None else sol.SolverConfig()
+    workers = workers if workers is not None else min(len(periods), os.cpu_count())
+    period_config = sol.SolverConfig(
+        config.name,
+        time_limit=config.time_limit,
+        mip_gap=config.mip_gap,
+        threads=max(1, config.threads // workers),
+        seed=config.seed,
+        executable=config.executable,
+    )
+    arguments = dict(
+        campus=campus,
+        mode=mode,
+        rooms=rooms,
+        presolve=presolve,
+        config=period_config,
+        output_dir=output_dir,
+        warm_start=warm_start,
+        seed=seed,
+        cache_dir=cache_dir,
+    )
+    print(f"Solving {len(periods)} periods on {workers} processes: {period_config}")
+    if workers > 1:
+        with ProcessPoolExecutor(workers) as pool:
+            futures = [
+                pool.submit(
+                    solve_period, name, number, data, rooms_data, qualifications, profiles, calendar, **arguments
+                )
+                for name, number in zip(periods, numbers)
+            ]
+            summaries = [future.result() for future in futures]
+    else:
+        summaries = [
+            solve_period(name, number, data, rooms_data, qualifications, profiles, calendar, **arguments)
+            for name, number in zip(periods, numbers)
+        ]
+
+    summary = pd.DataFrame(summaries).set_index("period")
+    os.makedirs(output_dir, exist_ok=True)
+    summary.to_csv(os.path.join(output_dir, "summary.csv"))
+    print(summary.to_string())
+    print(f"{len(periods)} periods solved in {time.perf_counter() - start:.1f}s")
+    return summary
+
+
+if __name__ == "__main__":
+    period = PERIODS
+    campus = ["San Giobbe", "Palazzo Moro"]
+    qualifications = json.load(open("data/Input/qualifications_levels.json"))
+    profiles = json.load(open("data/Input/profiles.json"))
+    calendar = (4, 6, 6)
+    seed = 0
+    solver = sol.SolverConfig("auto", time_limit=600, mip_gap=None, threads=None, seed=seed)
+    solve_periods(
+        period,
+        "data/Input/UniveCourses.csv",
+        "data/Input/aule_.csv",
+        qualifications,
+        profiles,
+        calendar,
+        campus=campus,
+        mode="relaxed",
+        rooms="types",
+        presolve=True,
+        config=solver,
+        output_dir="data/Output",
+        warm_start=False,
+        seed=seed,
+        cache_dir="data/cache",
+    )
@@ -0,0 +1,116 @@
+import pandas as pd
+
+import school_output as out
+
+
+# ------------------------------------Room assignment------------------------------------
+# second stage of the two-stage mode: the time slots come from a model without z (see
+# school_model.room_capacity) and every hour gets its rooms by a bipartite matching.
+# Compatible rooms form a size interval for every teaching, so Glover's greedy is a
+# maximum matching: going through the rooms from the smallest, each room takes the
+# waiting lecture whose largest compatible size is the smallest
+
+
+# {teaching name: room name} for the teachings of one hour; preferred rooms are kept
+# when still compatible and free, unmatched teachings are left out
+def match_rooms(teachings, school, preferred=None):
+    preferred = preferred if preferred is not None else {}
+    rooms = {}
+    taken = set()
+    for teaching in teachings:
+        room_name = preferred.get(teaching.name)
+        compatible = [room.name for room in school.get_rooms_by_teaching(teaching.name)]
+        if room_name in compatible and room_name not in taken:
+            rooms[teaching.name] = room_name
+            taken.add(room_name)
+
+    waiting = [teaching for teaching in teachings if teaching.name not in rooms]
+    bounds = {}
+    for teaching in waiting:
+        sizes = [room.size for room in school.get_rooms_by_teaching(teaching.name)]
+        if sizes:
+            bounds[teaching.name] = (min(sizes), max(sizes))
+    waiting = sorted((t for t in waiting if t.name in bounds), key=lambda t: (bounds[t.name], t.id))
+    free = sorted(
+        (room for room in school.room_classes if room.name not in taken), key=lambda room: (room.size, room.name)
+    )
+    for room in free:
+        best = None
+        for teaching in waiting:
+            low, high = bounds[teaching.name]
+            if low > room.size:
+                break
+            if high >= room.size and (best is None or high < bounds[best.name][1]):
+                best = teaching
+        if best is not None:
+            rooms[best.name] = room.name
+            waiting.remove(best)
+    # keeping the preferred rooms can block the matching, start over without them
+    if waiting and preferred:
+        return match_rooms(teachings, school)
+    return rooms
+
+
+# fill the room column of a long solution (see school_output.extract_solution) hour by
+# hour; rooms already in the solution are kept where possible
+def assign_rooms(solution, school, parameters):
+    school.build_room_compatibility(parameters[1])  # max_room_size
+    solution = solution.copy()
+    if "room" not in solution.columns:
+        solution["room"] = None
+    solution["room"] = solution["room"].astype(object)
+    lectures_count = 0
+    unmatched = 0
+    for (day, hour), lectures in solution.groupby(["day", "hour"], sort=True):
+        names = list(dict.fromkeys(lectures["teaching"]))
+        teachings = [school.teachings_by_name[name] for name in names]
+        preferred = lectures.dropna(subset=["room"]).groupby("teaching")["room"].first().to_dict()
+        rooms = match_rooms(teachings, school, preferred)
+        lectures_count += len(names)
+        unmatched += len(names) - len(rooms)
+        solution.loc[lectures.index, "room"] = lectures["teaching"].map(rooms).astype(object)
+    solution["room"] = solution["room"].where(pd.notna(solution["room"]), None)
+    print(f"Rooms assigned: {lectures_count - unmatched} lectures, {unmatched} without a room")
+    return solution
+
+
+# ------------------------------------Room types------------------------------------
+# name the rooms of a solution solved with room types (see school_model.room_type_variables):
+# types holds the (day, hour, teaching, campus, size) of every lecture; every hour the
+# lectures of a type get its rooms, a teaching keeping the room it had earlier in the
+# week when it is free
+def name_rooms(solution, types, school):
+    school.build_room_types()
+    home = {}
+    rooms = {}
+    for (day, hour, campus, size), lectures in types.groupby(["day", "hour", "campus", "size"], sort=True):
+        free = [room.name for room in school.room_types[(campus, size)]]
+        teachings = sorted(set(lectures["teaching"]))
+        waiting = []
+        for teaching in teachings:
+            if home.get(teaching) in free:
+                rooms[(day, hour, teaching)] = home[teaching]
+                free.remove(home[teaching])
+            else:
+                waiting.append(teaching)
+        for teaching in waiting:
+            home[teaching] = free.pop(0)
+            rooms[(day, hour, teaching)] = home[teaching]
+    solution = solution.copy()
+    solution["room"] = [
+        rooms.get((day, hour, teaching))
+        for day, hour, teaching in zip(solution["day"], solution["hour"], solution["teaching"])
+    ]
+    print(f"Rooms named: {len(rooms)} lectures in {len(school.room_types)} room types")
+    return solution
+
+
+# rooms of a solution extracted from a model built in any rooms mode (see
+# school_model.build_model): named from w, matched without z, already there with z
+def solution_rooms(model, solution, school, parameters):
+    if model.component("w") is not None:
+        types = out.nonzero_values(model.w, ["day", "hour", "teaching", "campus", "size"])
+        return name_rooms(solution, types, school)
+    if model.component("z") is None:
+        return assign_rooms(solution, school, parameters)
+    return solution
@@ -0,0 +1,250 @@
+import os
+import time
+
+import pyomo.environ as pyo
+
+
+# ------------------------------------Backends------------------------------------
+# solver name -> pyomo solver and its own name for each common option (None: not supported)
+SOLVERS = {
+    "cplex": (
+        "cplex",
+        dict(time_limit="timelimit", mip_gap="mip_tolerances_mipgap", threads="threads", seed="randomseed"),
+    ),
+    "highs": (
+        "appsi_highs",
+        dict(time_limit="time_limit", mip_gap="mip_rel_gap", threads="threads", seed="random_seed"),
+    ),
+    "cbc": (
+        "cbc",
+        dict(time_limit="sec", mip_gap="ratio", threads="threads", seed="randomCbcSeed"),
+    ),
+    "glpk": (
+        "glpk",
+        dict(time_limit="tmlim", mip_gap="mipgap", threads=None, seed="seed"),
+    ),
+}
+
+
+def available_solvers():
+    return [
+        name
+        for name, (pyomo_name, options) in SOLVERS.items()
+        if pyo.SolverFactory(pyomo_name).available(exception_flag=False)
+    ]
+
+
+# ------------------------------------Configuration------------------------------------
+# name is one of SOLVERS or "auto" (the first available one, in SOLVERS order)
+class SolverConfig:
+    def __init__(
+        self,
+        name="auto",
+        time_limit=600,
+        mip_gap=None,
+        threads=None,
+        seed=0,
+        executable=None,
+        tee=False,
+        warmstart=False,
+    ):
+        if name == "auto":
+            solvers = available_solvers()
+            if not solvers:
+                raise RuntimeError(f"No solver available, install one of: {', '.join(SOLVERS)}")
+            name = solvers[0]
+        elif name not in SOLVERS:
+            raise ValueError(f"Unknown solver {name!r}, choose one of: {', '.join(SOLVERS)}")
+        self.name = name
+        self.time_limit = time_limit
+        self.mip_gap = mip_gap
+        self.threads = threads if threads is not None else os.cpu_count()
+        self.seed = seed
+        self.executable = executable
+        self.tee = tee
+        # use the current variable values as a MIP start (see school_warmstart)
+        self.warmstart = warmstart
+
+    def __repr__(self):
+        return (
+            f"name={self.name}, time_limit={self.time_limit}, mip_gap={self.mip_gap}, "
+            f"threads={self.threads}, seed={self.seed}"
+        )
+
+    def options(self):
+        pyomo_name, option_names = SOLVERS[self.name]
+        options = {}
+        for option, value in (
+            ("time_limit", self.time_limit),
+            ("mip_gap", self.mip_gap),
+            ("threads", self.threads),
+            ("seed", self.seed),
+        ):
+            if value is not None and option_names[option] is not None:
+                options[option_names[option]] = value
+        return options
+
+    def create(self):
+        pyomo_name, option_names = SOLVERS[self.name]
+        if self.executable is not None:
+            solver = pyo.SolverFactory(pyomo_name, executable=self.executable)
+        else:
+            solver = pyo.SolverFactory(pyomo_name)
+        for option, value in self.options().items():
+            solver.options[option] = value
+        return solver
+
+
+# ------------------------------------Result------------------------------------
+class SolverResult:
+    __slots__ = ("solver", "status", "objective", "bound", "gap", "wall_time")
+
+    def __init__(self, solver, status, objective=None, bound=None, gap=None, wall_time=None):
+        self.solver = solver
+        self.status = status
+        self.objective = objective
+        self.bound = bound
+        self.gap = gap
+        self.wall_time = wall_time
+
+    def __repr__(self):
+        return f"{', '.join(f'{key}={getattr(self, key)}' for key in self.__slots__)}"
+
+    def has_solution(self):
+        return self.objective is not None
+
+
+def relative_gap(objective, bound):
+    if objective is None or bound is None or abs(bound) == float("inf"):
+        return None
+    return abs(objective - bound) / max(abs(objective), 1e-10)
+
+
+# ------------------------------------Solve------------------------------------
+# terminations of a solver that did not run to the end (not a time limit or an
+# infeasible model): without a solution they are raised as errors
+FAILURES = (
+    pyo.TerminationCondition.unknown,
+    pyo.TerminationCondition.error,
+    pyo.TerminationCondition.solverFailure,
+    pyo.TerminationCondition.internalSolverError,
+    pyo.TerminationCondition.licensingProblems,
+)
+
+
+# solve the model, load the solution (if any) and summarize the run; raises RuntimeError
+# if the solver fails without a solution
+def solve(model, config=None):
+    config = config if config is not None else SolverConfig()
+    solver = config.create()
+    start = time.perf_counter()
+    if config.warmstart and solver.warm_start_capable():
+        results = solver.solve(model, tee=config.tee, load_solutions=False, warmstart=True)
+    else:
+        results = solver.solve(model, tee=config.tee, load_solutions=False)
+    wall_time = time.perf_counter() - start
+
+    obj = next(model.component_data_objects(pyo.Objective, active=True))
+    objective = None
+    if len(results.solution) > 0:
+        model.solutions.load_from(results)
+        objective = pyo.value(obj)
+    elif results.solver.termination_condition in FAILURES:
+        raise RuntimeError(
+            f"{config.name} failed on the model (status {results.solver.status}, termination "
+            f"{results.solver.termination_condition}), see its log with tee=True"
+        )
+
+    if obj.sense == pyo.minimize:
+        bound = results.problem.lower_bound
+    else:
+        bound = results.problem.upper_bound
+    if bound is not None and not isinstance(bound, (int, float)):
+        bound = None
+    result = SolverResult(
+        solver=config.name,
+        status=str(results.solver.termination_condition),
+        objective=objective,
+        bound=bound,
+        gap=relative_gap(objective, bound),
+        wall_time=wall_time,
+    )
+    print("Solver result: ", result)
+    return result
+
+
+# ------------------------------------Incremental re-solve------------------------------------
+# keeps a built model attached to a persistent HiGHS instance: prof_cost and cal_cost
+# edits are pushed to the solver in place and every re-solve is warm started from the
+# previous incumbent, so nothing is rebuilt or re-sent between iterations
+class PersistentSolver:
+    # params_only: only parameters change between solves (see watch_params_only); set it
+    # to False when variables are fixed or unfixed between solves (see school_lns)
+    def __init__(self, model, config=None, params_only=True):
+        from pyomo.contrib.appsi.solvers import Highs
+
+        self.model = model
+        self.config = config if config is not None else SolverConfig("highs")
+        self.params_only = params_only
+        self.solver = Highs()
+        self.solver.config.time_limit = self.config.time_limit
+        self.solver.config.mip_gap = self.config.mip_gap
+        self.solver.config.stream_solver = self.config.tee
+        self.solver.config.load_solution = False
+        self.solver.config.warmstart = True
+        self.solver.highs_options = {
+            option: value
+            for option, value in dict(threads=self.config.threads, random_seed=self.config.seed).items()
+            if value is not None
+        }
+        # fixing or unfixing a variable only changes its bounds in HiGHS instead of
+        # rebuilding every constraint that uses it
+        if not params_only:
+            self.solver.update_config.treat_fixed_vars_as_params = False
+        self.results = []
+
+    # after the first solve only mutable parameters change: skip the scans for new,
+    # removed or modified constraints and variables
+    def watch_params_only(self):
+        update_config = self.solver.update_config
+        update_config.check_for_new_or_removed_constraints = False
+        update_config.check_for_new_or_removed_vars = False
+        update_config.check_for_new_or_removed_params = False
+        update_config.check_for_new_objective = False
+        update_config.update_constraints = False
+        update_config.update_vars = False
+        update_config.update_named_expressions = False
+        update_config.update_params = True
+
+    # costs: {(day, hour, teacher): cost}
+    def set_prof_cost(self, costs):
+        for index, cost in costs.items():
+            self.model.prof_cost[index] = cost
+
+    # costs: {(day, hour): cost}
+    def set_cal_cost(self, costs):
+        for index, cost in costs.items():
+            self.model.cal_cost[index] = cost
+
+    def solve(self):
+        start = time.perf_counter()
+        results = self.solver.solve(self.model)
+        wall_time = time.perf_counter() - start
+        if not self.results and self.params_only:
+            self.watch_params_only()
+
+        objective = results.best_feasible_objective
+        if objective is not None:
+            results.solution_loader.load_vars()
+        bound = results.best_objective_bound
+        result = SolverResult(
+            solver="highs (persistent)",
+            status=results.termination_condition.name,
+            objective=objective,
+            bound=bound,
+            gap=relative_gap(objective, bound),
+            wall_time=wall_time,
+        )
+        self.results.append(result)
+        print("Solver result: ", result)
+        return result
@@ -0,0 +1,136 @@
+import os
+
+import pandas as pd
+import pyomo.environ as pyo
+
+import school_heuristic as heu
+
+
+# ------------------------------------Reading------------------------------------
+# long (day, hour, column, cell) rows of a schedule csv written by school_output; columns
+# holding an object repr (older schedules) and empty cells are skipped
+def read_schedule(filename, column):
+    data = pd.read_csv(filename, index_col=[0, 1], dtype=str)
+    data = data[[c for c in data.columns if not c.startswith("name=")]]
+    data = data.rename_axis(["day", "hour"]).reset_index()
+    data = data.melt(id_vars=["day", "hour"], var_name=column, value_name="cell").dropna()
+    return data[~data["cell"].isin(["-", ""])]
+
+
+# course cells join their teachings with ", ", which also appears inside some teaching
+# names: grow each piece until it is a known teaching name
+def split_teachings(cell, teaching_names):
+    teachings = []
+    current = None
+    for piece in cell.split(", "):
+        current = piece if current is None else f"{current}, {piece}"
+        if current in teaching_names:
+            teachings.append(current)
+            current = None
+    return teachings
+
+
+# (day, hour, teaching) -> room (None if unknown) of every lecture found in the schedules
+def read_lectures(output_dir, school):
+    lectures = {}
+    rooms = os.path.join(output_dir, "schedule_rooms.csv")
+    if os.path.exists(rooms):
+        for row in read_schedule(rooms, "room").itertuples(index=False):
+            lectures[(int(row.day), int(row.hour), row.cell)] = row.room
+
+    teachers = os.path.join(output_dir, "schedule_teachers.csv")
+    if os.path.exists(teachers):
+        for row in read_schedule(teachers, "teacher").itertuples(index=False):
+            lectures.setdefault((int(row.day), int(row.hour), row.cell), None)
+
+    courses = os.path.join(output_dir, "schedule_courses.csv")
+    if os.path.exists(courses):
+        for row in read_schedule(courses, "course").itertuples(index=False):
+            for teaching in split_teachings(row.cell, school.teachings_by_name):
+                lectures.setdefault((int(row.day), int(row.hour), teaching), None)
+    return lectures
+
+
+# ------------------------------------Repair------------------------------------
+# keep the lectures that still make sense for the current school: the teaching and the
+# slot must exist, frequency, one lecture per teaching per day, professor ubiquity and daily
+# limit, student ubiquity and free rooms must hold; a lecture whose room is gone, too
+# small/big or taken is moved to a free compatible room
+def repair_lectures(lectures, school, parameters, professor_limit=3):
+    state = heu.TimetableState(school, parameters, professor_limit)
+    slots = set(state.slots)
+    report = dict(read=len(lectures), stale=0, conflicting=0, moved=0, survived=0)
+    for (day, hour, teaching_name), room_name in sorted(lectures.items(), key=lambda item: item[0]):
+        teaching = school.teachings_by_name.get(teaching_name)
+        if teaching is None or (day, hour) not in slots:
+            report["stale"] += 1
+            continue
+        room = state.free_room(teaching, day, hour, room_name)
+        if state.conflict(teaching, day, hour) or room is None:
+            report["conflicting"] += 1
+            continue
+        if room_name is not None and room.name != room_name:
+            report["moved"] += 1
+        state.place(teaching, day, hour, room)
+
+    report["survived"] = len(state.lectures)
+    report["missing"] = state.missing()
+    return state, report
+
+
+# ------------------------------------MIP start------------------------------------
+# set x, y and z (or w, given the school) from a long solution table; when the start is
+# complete every other variable is set to 0, otherwise left unset so solvers that accept
+# partial starts can complete it
+def apply_start(model, solution, complete=True, school=None):
+    # the two-stage model has no z, the room types model has w instead, and after a presolve
+    # y is an expression of x and y_free (see school_model.substitute_y)
+    variables = [
+        model.component(name)
+        for name in ("x", "y", "y_free", "z", "w")
+        if model.component(name) is not None and model.component(name).ctype is pyo.Var
+    ]
+    y = model.y if model.y.ctype is pyo.Var else model.component("y_free")
+    for var in variables:
+        for var_data in var.values():
+            var_data.set_value(0 if complete else None)
+
+    rooms = {}
+    if model.component("w") is not None and school is not None:
+        rooms = {room.name: room for room in school.room_classes}
+    for row in solution.itertuples(index=False):
+        if (row.day, row.hour, row.course, row.teaching) in model.x:
+            model.x[row.day, row.hour, row.course, row.teaching].set_value(1)
+        if y is not None and (row.day, row.hour, row.teacher, row.teaching) in y:
+            y[row.day, row.hour, row.teacher, row.teaching].set_value(1)
+        if model.component("z") is not None and (row.day, row.hour, row.teaching, row.room) in model.z:
+            model.z[row.day, row.hour, row.teaching, row.room].set_value(1)
+        room = rooms.get(row.room)
+        if room is not None and (row.day, row.hour, row.teaching, room.campus, room.size) in model.w:
+            model.w[row.day, row.hour, row.teaching, room.campus, room.size].set_value(1)
+
+
+# read the schedules in output_dir, repair them against the current school and place
+# the lectures still missing with the greedy heuristic
+def warm_state(school, parameters, output_dir, prof_cost):
+    lectures = read_lectures(output_dir, school)
+    state, report = repair_lectures(lectures, school, parameters)
+    print(
+        f"Warm start from {output_dir}: {report['survived']} of {report['read']} lectures survived "
+        f"({report['stale']} stale, {report['conflicting']} conflicting, {report['moved']} moved room), "
+        f"{report['missing']} still to place"
+    )
+    state, greedy_report = heu.greedy_timetable(school, parameters, prof_cost, state)
+    return state, report
+
+
+# load the warm state into the model as a MIP start (used when the solver config has
+# warmstart=True); lectures the greedy leaves alone on their day are dropped and the
+# start is left partial for the solver
+def load_warm_start(model, school, parameters, output_dir, prof_cost):
+    state, report = warm_state(school, parameters, output_dir, prof_cost)
+    for day, hour, teaching in state.presence_violations():
+        state.remove(teaching, day, hour)
+    solution = state.to_solution()
+    apply_start(model, solution, complete=state.missing() == 0, school=school)
+    return solution, report
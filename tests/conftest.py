@@ -0,0 +1,6 @@
+import os
+import sys
+
+# the school_* modules live at the top of the repository, next to data/
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
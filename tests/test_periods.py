@@ -0,0 +1,43 @@
+import json
+import os
+
+import pandas as pd
+import pytest
+
+import school_periods as per
+import school_solver as sol
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+INPUT = os.path.join(ROOT, "data", "Input")
+
+
+def test_period_number():
+    assert [per.period_number(name) for name in per.PERIODS] == [1, 2, 3, 4]
+    with pytest.raises(ValueError):
+        per.period_number("I Semestre")
+
+
+# a subset of the periods keeps the calendar numbers of the full list
+def test_solve_subset_of_periods(tmp_path):
+    qualifications = json.load(open(os.path.join(INPUT, "qualifications_levels.json")))
+    profiles = json.load(open(os.path.join(INPUT, "profiles.json")))
+    summary = per.solve_periods(
+        ["1° Periodo", "3° Periodo"],
+        os.path.join(INPUT, "UniveCourses.csv"),
+        os.path.join(INPUT, "aule_.csv"),
+        qualifications,
+        profiles,
+        (4, 6, 6),
+        campus=["Palazzo Moro"],
+        rooms="matching",
+        presolve=True,
+        config=sol.SolverConfig("highs", time_limit=30, threads=1),
+        output_dir=str(tmp_path),
+        workers=1,
+    )
+    assert sorted(path.name for path in tmp_path.iterdir() if path.is_dir()) == ["period_1", "period_3"]
+    assert list(summary.index) == ["1° Periodo", "3° Periodo"]
+    assert summary["objective"].notna().all()
+    for number in (1, 3):
+        assert os.path.exists(tmp_path / f"period_{number}" / "schedule_courses.csv")
+    assert list(pd.read_csv(tmp_path / "summary.csv")["period"]) == ["1° Periodo", "3° Periodo"]